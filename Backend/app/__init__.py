@@ -3,6 +3,15 @@ from .config import cargar_configuracion
 from .extensions import db, migrate, bcrypt, jwt, cors, limiter
 from .api import registrar_blueprints
 from .security.jwt_utils import registrar_callbacks_jwt
+from .cryptoutils.key_cache import cache_uek
+from .cryptoutils.kdf import limitador_kdf
+from .utils.blob_cache import cache_blobs
+from .utils.audit_sink import sumidero_auditoria
+from .cryptoutils.aes_parallel import configurar_motor_paralelo
+from .utils.readahead import configurar_readahead
+from .services.job_service import configurar_trabajos
+from .services.key_service import ClaveServicio
+from .cli import registrar_comandos
 
 def crear_app(config_name: str | None = None) -> Flask:
     app = Flask(__name__)
@@ -15,11 +24,25 @@ def crear_app(config_name: str | None = None) -> Flask:
     registrar_callbacks_jwt(jwt)
     cors.init_app(app)
     limiter.init_app(app)
+    cache_uek.configurar(app.config["KEY_CACHE_TTL_SECONDS"], app.config["KEY_CACHE_MAX_ENTRIES"])
+    limitador_kdf.configurar(app.config["KDF_MAX_CONCURRENT"], app.config["KDF_QUEUE_TIMEOUT_SECONDS"])
+    cache_blobs.configurar(app.config["BLOB_CACHE_MAX_BYTES"], app.config["BLOB_CACHE_MAX_ENTRY_BYTES"])
+    configurar_motor_paralelo(app.config["CRYPTO_WORKERS"], app.config["CRYPTO_CHUNKS_POR_TAREA"])
+    configurar_readahead(app.config["EXPORT_READAHEAD_WORKERS"])
+    configurar_trabajos(app.config["JOB_WORKERS"])
+    sumidero_auditoria.configurar(
+        app, app.config["AUDIT_ASYNC"], app.config["AUDIT_QUEUE_SIZE"], app.config["AUDIT_BATCH_SIZE"],
+        app.config["AUDIT_FLUSH_INTERVAL_SECONDS"], app.config["AUDIT_OVERFLOW_POLICY"],
+        app.config["AUDIT_OVERFLOW_WAIT_SECONDS"],
+    )
 
     registrar_blueprints(app)
+    registrar_comandos(app)
     
     # Inicializar datos básicos después de configurar todo
     with app.app_context():
+        # KEK raíz: el único Argon2 de la jerarquía de claves v2 se paga al arrancar
+        ClaveServicio.precalentar_kek_raiz()
         try:
             # Solo intentar si las tablas existen
             db.create_all()  # Crear tablas si no existen
@@ -1,4 +1,5 @@
-from flask import Flask
+from flask import Flask, jsonify
+from ..cryptoutils.kdf import KdfSaturado
 from .auth_controller import bp as auth_bp
 from .user_controller import bp as user_bp
 from .key_controller import bp as key_bp
@@ -8,6 +9,7 @@ from .admin_controller import bp as admin_bp
 from .dashboard_controller import bp as dashboard_bp
 from .debug_controller import bp as debug_bp
 from .file_crypto_controller import bp as file_crypto_bp
+from .job_controller import bp as job_bp
 
 def registrar_blueprints(app: Flask):
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
@@ -19,3 +21,11 @@ def registrar_blueprints(app: Flask):
     app.register_blueprint(dashboard_bp, url_prefix="/api/dashboard")
     app.register_blueprint(debug_bp, url_prefix="/api/debug")
     app.register_blueprint(file_crypto_bp, url_prefix="/api/archivos")
+    app.register_blueprint(job_bp, url_prefix="/api/trabajos")
+    app.register_error_handler(KdfSaturado, _kdf_saturado)
+
+def _kdf_saturado(e: KdfSaturado):
+    """Cola de derivación de claves llena: 503 para que el cliente reintente"""
+    resp = jsonify({"mensaje": str(e)})
+    resp.headers["Retry-After"] = str(e.reintentar_en)
+    return resp, 503
@@ -5,8 +5,17 @@ from ..services.user_service import UsuarioServicio
 from ..services.audit_service import AuditoriaServicio
 from ..models.user import Usuario
 from ..models.audit_log import RegistroAuditoria
+from ..repository.audit_repository import AuditoriaRepositorio
+from ..repository.audit_rollup_repository import ResumenAuditoriaRepositorio, GRANULARIDADES
 from ..models.file import Archivo
 from ..schemas.user_schemas import UsuarioSchema
+from ..schemas.job_schemas import TrabajoSchema
+from ..services.storage_service import AlmacenamientoServicio
+from ..services.key_service import ClaveServicio
+from ..utils.blob_cache import cache_blobs
+from ..cryptoutils.kdf import limitador_kdf
+from ..utils.audit_sink import sumidero_auditoria
+from ..utils.cursor import codificar_cursor, decodificar_cursor
 from ..extensions import db
 from sqlalchemy import func
 from datetime import datetime, timedelta
@@ -15,6 +24,9 @@ import os
 bp = Blueprint("admin", __name__)
 usuario_schema = UsuarioSchema()
 usuarios_schema = UsuarioSchema(many=True)
+trabajo_schema = TrabajoSchema()
+
+MAX_LIMITE_AUDITORIA = 500
 
 @bp.get("/stats")
 @jwt_required()
@@ -234,9 +246,7 @@ def obtener_actividad():
     try:
         limit = request.args.get('limit', 10, type=int)
         
-        registros = RegistroAuditoria.query.order_by(
-            RegistroAuditoria.creado_en.desc()
-        ).limit(limit).all()
+        registros = AuditoriaRepositorio.recientes(limit)
         
         actividad = []
         for registro in registros:
@@ -325,7 +335,11 @@ def obtener_estado_sistema():
                 "memoria": 62,
                 "disco": 78,
                 "red": 12
-            }
+            },
+            # Cola de derivación de claves (Argon2): en curso, en cola y tiempos de espera
+            "kdf": limitador_kdf.metricas(),
+            # Escritor de auditoría por lotes: pendientes, lotes escritos y desbordes
+            "auditoria": sumidero_auditoria.metricas()
         }
         
         return jsonify(estado), 200
@@ -397,12 +411,41 @@ def obtener_estadisticas_storage():
             "archivos_sin_ruta": archivos_sin_ruta,
             "archivos_null_backend": archivos_null_backend,
             "backend_configurado": current_app.config.get("FILE_STORAGE_BACKEND", "db_blob"),
-            "ruta_configurada": current_app.config.get("FILE_STORAGE_PATH", "./data_archivos")
+            "ruta_configurada": current_app.config.get("FILE_STORAGE_PATH", "./data_archivos"),
+            "cache_blobs": cache_blobs.estadisticas()
         }), 200
         
     except Exception as e:
         return jsonify({"error": f"Error obteniendo estadísticas de storage: {str(e)}"}), 500
 
+@bp.post("/storage/migrar-a-fs")
+@jwt_required()
+@requiere_admin
+def migrar_storage_a_fs():
+    """Mover en segundo plano los blobs guardados en la base de datos al backend fs"""
+    admin_id = int(get_jwt_identity())
+    try:
+        trabajo = AlmacenamientoServicio.iniciar_migracion_a_fs(admin_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    resp = jsonify({"trabajo": trabajo_schema.dump(trabajo)})
+    resp.headers["Location"] = f"/api/trabajos/{trabajo.id}"
+    return resp, 202
+
+@bp.post("/claves/migrar-jerarquia")
+@jwt_required()
+@requiere_admin
+def migrar_jerarquia_claves():
+    """Reenvolver en segundo plano las UEK antiguas con KEK derivadas de la KEK raíz (HKDF)"""
+    admin_id = int(get_jwt_identity())
+    try:
+        trabajo = ClaveServicio.iniciar_migracion_jerarquia(admin_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    resp = jsonify({"trabajo": trabajo_schema.dump(trabajo)})
+    resp.headers["Location"] = f"/api/trabajos/{trabajo.id}"
+    return resp, 202
+
 @bp.post("/usuarios")
 @jwt_required()
 @requiere_admin
@@ -525,45 +568,47 @@ def actualizar_usuario(usuario_id):
 @jwt_required()
 @requiere_admin
 def obtener_auditoria():
-    """Obtener registros de auditoría con filtros opcionales"""
+    """
+    Obtener registros de auditoría con filtros opcionales, paginados por
+    clave: la respuesta trae en X-Cursor-Siguiente el cursor de la página
+    siguiente (ausente en la última), que se pasa como ?cursor=...
+    """
     try:
         # Parámetros de consulta
-        limit = request.args.get('limit', 50, type=int)
-        offset = request.args.get('offset', 0, type=int)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_LIMITE_AUDITORIA)
+        cursor = request.args.get('cursor')
         accion = request.args.get('accion')
         estado = request.args.get('estado')
         fecha_desde = request.args.get('fecha_desde')
         fecha_hasta = request.args.get('fecha_hasta')
-        
-        # Construir query base
-        query = RegistroAuditoria.query
-        
-        # Aplicar filtros
-        if accion:
-            query = query.filter(RegistroAuditoria.accion == accion)
-        
-        if estado:
-            query = query.filter(RegistroAuditoria.estado == estado)
-        
+
+        if request.args.get('offset', 0, type=int):
+            return jsonify({"error": "offset ya no se admite: usa el cursor de X-Cursor-Siguiente"}), 400
+        try:
+            despues_de = decodificar_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        fecha_desde_dt = fecha_hasta_dt = None
         if fecha_desde:
             try:
                 fecha_desde_dt = datetime.fromisoformat(fecha_desde.replace('Z', '+00:00'))
-                query = query.filter(RegistroAuditoria.creado_en >= fecha_desde_dt)
             except ValueError:
                 pass
         
         if fecha_hasta:
             try:
                 fecha_hasta_dt = datetime.fromisoformat(fecha_hasta.replace('Z', '+00:00'))
-                query = query.filter(RegistroAuditoria.creado_en <= fecha_hasta_dt)
             except ValueError:
                 pass
         
-        # Ordenar y paginar
-        registros = query.order_by(RegistroAuditoria.creado_en.desc()).offset(offset).limit(limit).all()
+        # Página por (creado_en, id) descendente; cada combinación de filtros tiene su índice
+        registros, siguiente = AuditoriaRepositorio.pagina(
+            limit, despues_de, accion=accion, estado=estado, desde=fecha_desde_dt, hasta=fecha_hasta_dt
+        )
         
         # Si no hay registros, crear algunos de ejemplo para demostración
-        if not registros and limit <= 10:
+        if not registros and limit <= 10 and not cursor:
             # Crear registros de ejemplo solo si la base de datos está vacía
             total_registros = RegistroAuditoria.query.count()
             if total_registros == 0:
@@ -634,10 +679,51 @@ def obtener_auditoria():
                 print(f"DEBUG: Error procesando registro {registro.id}: {str(e)}")
                 continue
         
-        return jsonify(resultado), 200
+        respuesta = jsonify(resultado)
+        if siguiente:
+            respuesta.headers['X-Cursor-Siguiente'] = codificar_cursor(*siguiente)
+        return respuesta, 200
         
     except Exception as e:
         print(f"DEBUG: Error en obtener_auditoria: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"Error obteniendo registros de auditoría: {str(e)}"}), 500
+
+@bp.get("/auditoria/resumen")
+@jwt_required()
+@requiere_admin
+def obtener_resumen_auditoria():
+    """
+    Serie de totales de auditoría desde los resúmenes por hora o día (no lee
+    registros_auditoria). Parámetros: granularidad (hora|dia), fecha_desde,
+    fecha_hasta, accion, estado, usuario_id (0 = sistema) y por (columnas
+    separadas por comas: accion, estado, actor_usuario_id).
+    """
+    granularidad = request.args.get('granularidad', 'dia')
+    if granularidad not in GRANULARIDADES:
+        return jsonify({"error": f"granularidad debe ser una de {GRANULARIDADES}"}), 400
+    por = tuple(c for c in request.args.get('por', '').split(',') if c)
+    if any(c not in ('accion', 'estado', 'actor_usuario_id') for c in por):
+        return jsonify({"error": "por admite accion, estado y actor_usuario_id"}), 400
+    try:
+        hasta = datetime.fromisoformat(request.args['fecha_hasta'].replace('Z', '+00:00')).replace(tzinfo=None) \
+            if request.args.get('fecha_hasta') else datetime.utcnow()
+        desde = datetime.fromisoformat(request.args['fecha_desde'].replace('Z', '+00:00')).replace(tzinfo=None) \
+            if request.args.get('fecha_desde') else hasta - (timedelta(days=30) if granularidad == 'dia' else timedelta(hours=48))
+    except ValueError:
+        return jsonify({"error": "Fechas en formato ISO 8601"}), 400
+
+    serie = ResumenAuditoriaRepositorio.serie(
+        granularidad, desde, hasta,
+        accion=request.args.get('accion'),
+        estado=request.args.get('estado'),
+        usuario_id=request.args.get('usuario_id', type=int),
+        por=por,
+    )
+    return jsonify({
+        "granularidad": granularidad,
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "serie": serie,
+    }), 200
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required
 from ..security.permissions import requiere_admin
-from ..models.audit_log import RegistroAuditoria
+from ..repository.audit_repository import AuditoriaRepositorio
 from ..schemas.audit_schemas import AuditoriaSchema
 
 bp = Blueprint("auditoria", __name__)
@@ -11,5 +11,5 @@ schema = AuditoriaSchema(many=True)
 @jwt_required()
 @requiere_admin
 def listar():
-    registros = RegistroAuditoria.query.order_by(RegistroAuditoria.creado_en.desc()).limit(200).all()
+    registros = AuditoriaRepositorio.recientes(200)
     return schema.dump(registros), 200
@@ -1,15 +1,36 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..security.permissions import requiere_usuario
 from ..services.file_service import ArchivoServicio
 from ..repository.file_repository import ArchivoRepositorio
 from ..schemas.file_schemas import ArchivoRespuestaSchema
-from ..models.file import Archivo
-from io import BytesIO
+from ..schemas.job_schemas import TrabajoSchema
+from ..schemas.upload_schemas import SesionSubidaCrearSchema, SesionSubidaSchema
+from ..services.upload_service import SubidaServicio
+from ..repository.upload_session_repository import SesionSubidaRepositorio
+from marshmallow import ValidationError
+from datetime import datetime
+from ..utils.storage import ruta_temporal_subida, cabecera_sendfile
+from urllib.parse import quote
+import unicodedata
+from werkzeug.datastructures import Headers
 
 bp = Blueprint("archivos", __name__)
 resp_schema = ArchivoRespuestaSchema()
 resp_schema_many = ArchivoRespuestaSchema(many=True)
+trabajo_schema = TrabajoSchema()
+sesion_crear_schema = SesionSubidaCrearSchema()
+sesion_schema = SesionSubidaSchema()
+
+def cabeceras_descarga(cabeceras: Headers, nombre: str) -> None:
+    """Content-Disposition de adjunto con el mismo formato que usa send_file"""
+    try:
+        nombre.encode("ascii")
+        nombres = {"filename": nombre}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode("ascii")
+        nombres = {"filename": simple, "filename*": "UTF-8''" + quote(nombre, safe="!#$&+-.^_`|~")}
+    cabeceras.set("Content-Disposition", "attachment", **nombres)
 
 @bp.post("/cifrar")
 @jwt_required()
@@ -21,17 +42,166 @@ def cifrar():
         return jsonify({"mensaje": "Falta archivo"}), 400
         
     archivo_subido = request.files["archivo"]
-    data = archivo_subido.read()
+    
+    # Modo asíncrono: volcar a disco, encolar el cifrado y responder enseguida
+    asincrono = request.args.get("asincrono", str(current_app.config["FILE_ASYNC_UPLOADS"]))
+    if asincrono.lower() in ("1", "true"):
+        ruta_temporal = ruta_temporal_subida()
+        archivo_subido.save(ruta_temporal)
+        trabajo = ArchivoServicio.cifrar_en_segundo_plano(
+            propietario_id=usuario_id,
+            nombre=archivo_subido.filename,
+            tipo_mime=archivo_subido.mimetype,
+            ruta_temporal=ruta_temporal,
+            ip=request.remote_addr,
+            user_agent=request.headers.get("User-Agent")
+        )
+        resp = jsonify({"trabajo": trabajo_schema.dump(trabajo)})
+        resp.headers["Location"] = f"/api/trabajos/{trabajo.id}"
+        return resp, 202
+    
+    # Se pasa el flujo (no .read()) para cifrar por chunks sin cargar el archivo en memoria
     arch = ArchivoServicio.cifrar_y_guardar(
         propietario_id=usuario_id,
         nombre=archivo_subido.filename,
         tipo_mime=archivo_subido.mimetype,
-        data=data,
+        data=archivo_subido.stream,
         ip=request.remote_addr,
         user_agent=request.headers.get("User-Agent")
     )
     return resp_schema.dump(arch), 201
 
+@bp.post("/cifrar-lote")
+@jwt_required()
+@requiere_usuario
+def cifrar_lote():
+    """Cifrar varios archivos (campo multipart 'archivos' repetido) en una sola petición"""
+    usuario_id = int(get_jwt_identity())
+    
+    subidos = request.files.getlist("archivos")
+    if not subidos:
+        return jsonify({"mensaje": "Faltan archivos"}), 400
+    
+    try:
+        resultados = ArchivoServicio.cifrar_y_guardar_lote(
+            propietario_id=usuario_id,
+            archivos=[(a.filename, a.mimetype, a.stream) for a in subidos],
+            ip=request.remote_addr,
+            user_agent=request.headers.get("User-Agent")
+        )
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 400
+    
+    cuerpo = [
+        {"nombre": r["nombre"], "archivo": resp_schema.dump(r["archivo"])} if "archivo" in r
+        else {"nombre": r["nombre"], "error": r["error"]}
+        for r in resultados
+    ]
+    exitosos = sum(1 for r in resultados if "archivo" in r)
+    if exitosos == len(resultados):
+        estado = 201
+    elif exitosos == 0:
+        estado = 400
+    else:
+        estado = 207  # Multi-Status: éxito parcial
+    return jsonify({"resultados": cuerpo, "exitosos": exitosos, "fallidos": len(resultados) - exitosos}), estado
+
+def _sesion_propia(sesion_id: int, usuario_id: int):
+    sesion = SesionSubidaRepositorio.buscar_por_id(sesion_id)
+    if not sesion or sesion.propietario_id != usuario_id:
+        return None
+    return sesion
+
+def _sesion_respuesta(sesion) -> dict:
+    return {**sesion_schema.dump(sesion), "partes_recibidas": SubidaServicio.partes_recibidas(sesion)}
+
+@bp.post("/subidas")
+@jwt_required()
+@requiere_usuario
+def crear_subida():
+    """Abrir una subida reanudable por partes. Cuerpo JSON: {"nombre", "tipo_mime", "tamano"}"""
+    usuario_id = int(get_jwt_identity())
+    try:
+        datos = sesion_crear_schema.load(request.get_json(silent=True) or {})
+        sesion = SubidaServicio.crear_sesion(usuario_id, datos["nombre"], datos.get("tipo_mime"), datos["tamano"])
+    except ValidationError as e:
+        return jsonify({"mensaje": "Datos inválidos", "errores": e.messages}), 400
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 400
+    resp = jsonify(_sesion_respuesta(sesion))
+    resp.headers["Location"] = f"/api/archivos/subidas/{sesion.id}"
+    return resp, 201
+
+@bp.get("/subidas/<int:sesion_id>")
+@jwt_required()
+@requiere_usuario
+def estado_subida(sesion_id: int):
+    """Estado de la sesión y partes ya recibidas (para reanudar sólo las que faltan)"""
+    sesion = _sesion_propia(sesion_id, int(get_jwt_identity()))
+    if not sesion:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    return jsonify(_sesion_respuesta(sesion)), 200
+
+@bp.put("/subidas/<int:sesion_id>/partes/<int:numero>")
+@jwt_required()
+@requiere_usuario
+def subir_parte(sesion_id: int, numero: int):
+    """Subir la parte `numero` (cuerpo binario). Las partes pueden llegar en cualquier orden y a la vez"""
+    sesion = _sesion_propia(sesion_id, int(get_jwt_identity()))
+    if not sesion:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    if sesion.estado != "abierta":
+        return jsonify({"mensaje": f"La sesión está {sesion.estado}"}), 409
+    if sesion.expira_en < datetime.utcnow():
+        return jsonify({"mensaje": "La sesión ha caducado"}), 410
+    if 0 <= numero < sesion.partes and request.content_length is not None \
+            and request.content_length != sesion.tamano_de_parte(numero):
+        return jsonify({"mensaje": f"La parte {numero} debe tener {sesion.tamano_de_parte(numero)} bytes"}), 400
+    try:
+        SubidaServicio.recibir_parte(sesion, numero, request.stream)
+    except FileExistsError as e:
+        return jsonify({"mensaje": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 400
+    return jsonify({"parte": numero}), 201
+
+@bp.post("/subidas/<int:sesion_id>/completar")
+@jwt_required()
+@requiere_usuario
+def completar_subida(sesion_id: int):
+    """Consolidar las partes en un archivo; responde 202 con el trabajo que lo hace"""
+    sesion = _sesion_propia(sesion_id, int(get_jwt_identity()))
+    if not sesion:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    faltantes = SubidaServicio.partes_faltantes(sesion)
+    if faltantes:
+        return jsonify({"mensaje": "Faltan partes", "faltantes": faltantes}), 409
+    try:
+        trabajo = SubidaServicio.completar(
+            sesion,
+            ip=request.remote_addr,
+            user_agent=request.headers.get("User-Agent")
+        )
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 409
+    resp = jsonify({"trabajo": trabajo_schema.dump(trabajo)})
+    resp.headers["Location"] = f"/api/trabajos/{trabajo.id}"
+    return resp, 202
+
+@bp.delete("/subidas/<int:sesion_id>")
+@jwt_required()
+@requiere_usuario
+def cancelar_subida(sesion_id: int):
+    """Cancelar una subida abierta y descartar sus partes"""
+    sesion = _sesion_propia(sesion_id, int(get_jwt_identity()))
+    if not sesion:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    try:
+        SubidaServicio.cancelar(sesion)
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 409
+    return jsonify({"mensaje": "Subida cancelada"}), 200
+
 @bp.get("/descifrar/<int:archivo_id>")
 @jwt_required()
 @requiere_usuario
@@ -41,8 +211,62 @@ def descifrar(archivo_id: int):
     arch = ArchivoRepositorio.buscar_por_id(archivo_id)
     if not arch or arch.propietario_id != usuario_id:
         return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
-    datos = ArchivoServicio.descargar_y_descifrar(arch, usuario_id)
-    return send_file(BytesIO(datos), as_attachment=True, download_name=arch.nombre_original, mimetype=arch.tipo_mime or "application/octet-stream")
+    mimetype = arch.tipo_mime or "application/octet-stream"
+    rango = ArchivoServicio.rango_solicitado(arch, request.range, request.headers.get("If-Range"))
+    if rango == "invalido":
+        resp = Response(status=416)
+        resp.headers["Content-Range"] = f"bytes */{arch.tamano_bytes}"
+        return resp
+    if rango is not None:
+        # Range: sólo se descifran los chunks que cubren el rango pedido
+        inicio, fin = rango
+        flujo = ArchivoServicio.descifrar_rango_en_flujo(arch, usuario_id, inicio, fin)
+        resp = Response(stream_with_context(flujo), status=206, mimetype=mimetype)
+        resp.headers["Content-Range"] = f"bytes {inicio}-{fin - 1}/{arch.tamano_bytes}"
+        resp.headers["Content-Length"] = str(fin - inicio)
+    else:
+        # Se responde en streaming: cada chunk se descifra y verifica justo antes de enviarse
+        flujo = ArchivoServicio.descifrar_en_flujo(arch, usuario_id)
+        resp = Response(stream_with_context(flujo), mimetype=mimetype)
+        if arch.tamano_bytes is not None:
+            resp.headers["Content-Length"] = str(arch.tamano_bytes)
+    cabeceras_descarga(resp.headers, arch.nombre_original)
+    if ArchivoServicio.admite_rangos(arch):
+        resp.headers["Accept-Ranges"] = "bytes"
+        if arch.hash_verificacion:
+            resp.set_etag(arch.hash_verificacion)
+    return resp
+
+@bp.post("/exportar")
+@jwt_required()
+@requiere_usuario
+def exportar():
+    """Descargar varios archivos descifrados en un ZIP generado en streaming.
+    Cuerpo JSON: {"ids": [1, 2, ...]} o {"todos": true}"""
+    usuario_id = int(get_jwt_identity())
+    datos = request.get_json(silent=True) or {}
+    
+    ids = None
+    if not datos.get("todos"):
+        ids = datos.get("ids")
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"mensaje": "Indique 'ids' o 'todos'"}), 400
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            return jsonify({"mensaje": "Los ids deben ser enteros"}), 400
+    archivos = ArchivoRepositorio.listar_para_exportar(usuario_id, ids)
+    if not archivos:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    
+    flujo = ArchivoServicio.exportar_zip(
+        usuario_id, archivos,
+        ip=request.remote_addr,
+        user_agent=request.headers.get("User-Agent")
+    )
+    resp = Response(stream_with_context(flujo), mimetype="application/zip")
+    cabeceras_descarga(resp.headers, "archivos.zip")
+    return resp
 
 @bp.get("/<int:archivo_id>")
 @jwt_required()
@@ -65,8 +289,8 @@ def listar_archivos():
     usuario_id = int(get_jwt_identity())  # Convertir de string a int
     
     try:
-        # Obtener archivos del usuario
-        archivos = Archivo.query.filter_by(propietario_id=usuario_id).order_by(Archivo.creado_en.desc()).all()
+        # Obtener archivos del usuario (sin el blob cifrado: sólo metadatos)
+        archivos = ArchivoRepositorio.listar_metadatos(usuario_id)
         
         # Serializar usando el schema
         return jsonify(resp_schema_many.dump(archivos)), 200
@@ -86,12 +310,28 @@ def descargar_cifrado(archivo_id: int):
         return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
     
     try:
-        # Obtener datos cifrados directamente del storage
-        datos_cifrados = ArchivoServicio.obtener_datos_cifrados(arch)
         nombre_cifrado = f"{arch.nombre_original}.encrypted"
+        backend, ruta, _ = arch.ubicacion_blob()
+        if backend == "fs":
+            # Con proxy delante, que sea él quien lea el archivo
+            sendfile = cabecera_sendfile(ruta)
+            if sendfile:
+                resp = Response(mimetype="application/octet-stream")
+                resp.headers[sendfile[0]] = sendfile[1]
+                cabeceras_descarga(resp.headers, nombre_cifrado)
+                return resp
+            # Por ruta: el servidor WSGI puede usar sendfile() (wsgi.file_wrapper)
+            return send_file(
+                ruta,
+                as_attachment=True,
+                download_name=nombre_cifrado,
+                mimetype="application/octet-stream",
+                conditional=True
+            )
         
+        # Resto de backends (db_blob, s3...): flujo del backend o de la cache de blobs
         return send_file(
-            BytesIO(datos_cifrados), 
+            ArchivoServicio.abrir_cifrado(arch), 
             as_attachment=True, 
             download_name=nombre_cifrado, 
             mimetype="application/octet-stream"
@@ -111,8 +351,8 @@ def eliminar_archivo(archivo_id: int):
         return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
     
     try:
-        # Eliminar archivo de la base de datos
-        ArchivoRepositorio.eliminar(arch)
+        # Eliminar archivo de la base de datos (y su blob si ya no lo usa nadie)
+        ArchivoServicio.eliminar(arch)
         return jsonify({"mensaje": "Archivo eliminado exitosamente"}), 200
     except Exception as e:
         return jsonify({"mensaje": f"Error eliminando archivo: {str(e)}"}), 500
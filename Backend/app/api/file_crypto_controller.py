@@ -4,8 +4,13 @@ from app.cryptoutils.file_crypto_utils import decrypt_file_aes
 from app.models.encryption_key import ClaveCifradoUsuario
 from app.models.file import Archivo
 from app.cryptoutils.keywrap import desarrollar
+from app.services.key_service import ClaveServicio
 from app.cryptoutils.aes import descifrar_aes_gcm
+from app.cryptoutils.aes_stream import descifrar_flujo
+from app.cryptoutils.kdf import KdfSaturado
+from app.utils.compression import descomprimir_flujo
 import tempfile
+import io
 
 bp = Blueprint('file_crypto', __name__)
 
@@ -41,17 +46,8 @@ def decrypt_download():
         
         print(f"Clave encontrada: ID {clave_obj.id}")
         
-        # Obtener MASTER_SECRET y derivar KEK
-        import os
-        from app.cryptoutils.kdf import derivar_kek
-        
-        master_secret = os.getenv("MASTER_SECRET", "cambia-esto").encode()
-        
-        # Derivar KEK usando el salt almacenado con la clave
-        kek, _, _ = derivar_kek(master_secret, clave_obj.kdf_salt)
-        
-        # Desenvolver la clave real del usuario
-        clave_usuario_real = desarrollar(kek, clave_obj.uek_envuelta)
+        # Desenvolver la clave real del usuario (KEK derivada de MASTER_SECRET, con cache)
+        clave_usuario_real = ClaveServicio.desenvolver_uek(clave_obj)
         print(f"Clave del usuario obtenida: {len(clave_usuario_real)} bytes")
         
         # Este endpoint es para descifrar archivos descargados desde la interfaz,
@@ -72,6 +68,10 @@ def decrypt_download():
         
         print(f"Archivo encontrado en DB: ID {archivo_db.id}")
         
+        # Si la DEK sigue envuelta con una UEK anterior (rotación pendiente), usar esa
+        if archivo_db.clave_id not in (None, clave_obj.id):
+            clave_usuario_real = ClaveServicio.uek_para_archivo(archivo_db)
+        
         # Obtener la clave DEK del archivo usando la función ya importada
         dek = desarrollar(clave_usuario_real, archivo_db.dek_envuelta)
         print(f"DEK del archivo obtenida: {len(dek)} bytes")
@@ -79,12 +79,24 @@ def decrypt_download():
         # Descifrar usando los metadatos del archivo de la DB
         # El raw contiene los datos cifrados que se descargaron
         # Pero necesitamos usar nonce y tag de la base de datos
-        decrypted_bytes = descifrar_aes_gcm(
-            dek, 
-            archivo_db.nonce, 
-            archivo_db.tag, 
-            archivo_db.blob_cifrado or raw  # Usar blob_cifrado si está disponible
-        )
+        if (archivo_db.metadatos or {}).get("version", 1) >= 2:
+            # Formato por chunks: nonce almacenado es el prefijo y cada chunk lleva su tag
+            decrypted_bytes = b"".join(descomprimir_flujo(
+                archivo_db.metadatos.get("compresion"),
+                descifrar_flujo(
+                    dek,
+                    archivo_db.nonce,
+                    io.BytesIO(archivo_db.ubicacion_blob()[2] or raw),
+                    archivo_db.metadatos["tamano_chunk"]
+                )
+            ))
+        else:
+            decrypted_bytes = descifrar_aes_gcm(
+                dek, 
+                archivo_db.nonce, 
+                archivo_db.tag, 
+                archivo_db.ubicacion_blob()[2] or raw  # Usar blob_cifrado si está disponible
+            )
         
         print(f"Descifrado exitoso, {len(decrypted_bytes)} bytes")
         
@@ -103,6 +115,8 @@ def decrypt_download():
         print(f"Enviando archivo descifrado: {original_filename}")
         return send_file(temp.name, as_attachment=True, download_name=original_filename, mimetype='application/octet-stream')
         
+    except KdfSaturado:
+        raise
     except Exception as e:
         print(f"ERROR en descifrado: {str(e)}")
         import traceback
@@ -0,0 +1,40 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from ..security.permissions import requiere_usuario_o_admin
+from ..services.job_service import TrabajoServicio
+from ..repository.job_repository import TrabajoRepositorio
+from ..schemas.job_schemas import TrabajoSchema
+
+bp = Blueprint("trabajos", __name__)
+schema = TrabajoSchema()
+
+def _trabajo_visible(trabajo_id: int):
+    """El trabajo si es del usuario actual (o si es ADMIN); None en otro caso"""
+    trabajo = TrabajoRepositorio.buscar_por_id(trabajo_id)
+    if not trabajo:
+        return None
+    if trabajo.usuario_id != int(get_jwt_identity()) and "ADMIN" not in (get_jwt() or {}).get("roles", []):
+        return None
+    return trabajo
+
+@bp.get("/<int:trabajo_id>")
+@jwt_required()
+@requiere_usuario_o_admin
+def estado(trabajo_id: int):
+    """Estado y progreso de un trabajo en segundo plano"""
+    trabajo = _trabajo_visible(trabajo_id)
+    if not trabajo:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    return jsonify(schema.dump(trabajo)), 200
+
+@bp.post("/<int:trabajo_id>/reanudar")
+@jwt_required()
+@requiere_usuario_o_admin
+def reanudar(trabajo_id: int):
+    """Reanuda desde su último lote confirmado un trabajo fallido o interrumpido"""
+    trabajo = _trabajo_visible(trabajo_id)
+    if not trabajo:
+        return jsonify({"mensaje": "No encontrado o sin permiso"}), 404
+    if not TrabajoServicio.reanudar(trabajo):
+        return jsonify({"mensaje": "El trabajo ya terminó o se está ejecutando"}), 409
+    return jsonify(schema.dump(trabajo)), 202
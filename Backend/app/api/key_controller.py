@@ -4,10 +4,12 @@ from datetime import datetime
 from ..security.permissions import requiere_usuario
 from ..services.key_service import ClaveServicio
 from ..schemas.key_schemas import ClaveSchema
+from ..schemas.job_schemas import TrabajoSchema
 from ..repository.encryption_key_repository import ClaveRepositorio
 
 bp = Blueprint("claves", __name__)
 clave_schema = ClaveSchema()
+trabajo_schema = TrabajoSchema()
 
 @bp.post("/generar")
 @jwt_required()
@@ -36,3 +38,18 @@ def activa():
     if not clave:
         return jsonify({"mensaje": "No hay clave activa"}), 404
     return clave_schema.dump(clave), 200
+
+@bp.post("/rotar")
+@jwt_required()
+@requiere_usuario
+def rotar():
+    """Nueva UEK + reenvoltorio en segundo plano de las DEK de todos los archivos"""
+    usuario_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    etiqueta = data.get('etiqueta', f'Clave-{usuario_id}-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+    
+    try:
+        trabajo = ClaveServicio.rotar_uek(usuario_id, etiqueta=etiqueta)
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 409
+    return jsonify({"trabajo": trabajo_schema.dump(trabajo)}), 202
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from flask_jwt_extended import decode_token
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_options_header, parse_range_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
+from .api.file_controller import cabeceras_descarga, resp_schema, resp_schema_many, trabajo_schema
+from .repository.file_repository import ArchivoRepositorio
+from .services.file_service import ArchivoServicio
+from .cryptoutils.kdf import KdfSaturado
+from .utils.storage import ruta_temporal_subida, cabecera_sendfile
+from .utils.audit_sink import sumidero_auditoria
+
+# Modo ASGI: los endpoints de archivos que mueven datos (cifrar, descifrar,
+# descargar-cifrado y el listado) se sirven con asyncio, de modo que un cliente
+# lento sólo ocupa una corrutina mientras sube o descarga. El trabajo bloqueante
+# (DB, Argon2, AES-GCM, disco) va a un pool de hilos acotado, trozo a trozo.
+# Cualquier otra ruta pasa a la app Flask a través de WsgiToAsgi.
+
+TAMANO_LECTURA = 64 * 1024
+
+class _ErrorHttp(Exception):
+    def __init__(self, estado: int, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+class ArchivosAsgi:
+    def __init__(self, app: Flask):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config["ASGI_EXECUTOR_WORKERS"], thread_name_prefix="asgi"
+        )
+        self.rutas: list[tuple[str, re.Pattern, Callable]] = [
+            ("POST", re.compile(r"^/api/archivos/cifrar$"), self._cifrar),
+            ("GET", re.compile(r"^/api/archivos/descifrar/(\d+)$"), self._descifrar),
+            ("GET", re.compile(r"^/api/archivos/descargar-cifrado/(\d+)$"), self._descargar_cifrado),
+            ("GET", re.compile(r"^/api/archivos/?$"), self._listar),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._ciclo_de_vida(receive, send)
+        if scope["type"] == "http":
+            for metodo, patron, manejador in self.rutas:
+                coincidencia = patron.match(scope["path"])
+                if coincidencia and scope["method"] == metodo:
+                    try:
+                        return await manejador(scope, receive, send, *coincidencia.groups())
+                    except _ErrorHttp as e:
+                        return await self._json(send, e.estado, {"mensaje": e.mensaje})
+                    except KdfSaturado as e:
+                        return await self._json(send, 503, {"mensaje": str(e)},
+                                                Headers({"Retry-After": str(e.reintentar_en)}))
+        return await self.wsgi(scope, receive, send)
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                # Lo que quede en la cola de auditoría se escribe antes de salir
+                await asyncio.get_running_loop().run_in_executor(None, sumidero_auditoria.cerrar)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ------------------------------------------------------------------ utilidades
+
+    async def _en_hilo(self, funcion: Callable, *args):
+        """Ejecuta `funcion` en el pool, dentro de un app_context propio."""
+        def _con_contexto():
+            with self.app.app_context():
+                return funcion(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, _con_contexto)
+
+    async def _siguiente(self, iterador: Iterator[bytes]) -> bytes | None:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, next, iterador, None)
+
+    @staticmethod
+    def _cabeceras(scope) -> Headers:
+        return Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+
+    def _autenticar(self, scope) -> int:
+        """Mismo control que @jwt_required + @requiere_usuario: Bearer válido con rol USER."""
+        autorizacion = self._cabeceras(scope).get("Authorization", "")
+        if not autorizacion.startswith("Bearer "):
+            raise _ErrorHttp(401, "Token no enviado o cabecera inválida")
+        with self.app.app_context():
+            try:
+                claims = decode_token(autorizacion[7:])
+            except Exception:
+                raise _ErrorHttp(401, "Token inválido")
+        if claims.get("type") != "access":
+            raise _ErrorHttp(401, "Token inválido")
+        if "USER" not in claims.get("roles", []):
+            raise _ErrorHttp(403, "No autorizado. Rol requerido.")
+        return int(claims["sub"])
+
+    @staticmethod
+    def _cabeceras_cors(cabeceras: Headers) -> Headers:
+        # Igual que flask-cors para /api/*; los preflight OPTIONS siguen yendo a Flask
+        cabeceras.setdefault("Access-Control-Allow-Origin", "*")
+        return cabeceras
+
+    async def _empezar(self, send, estado: int, cabeceras: Headers) -> None:
+        self._cabeceras_cors(cabeceras)
+        await send({
+            "type": "http.response.start",
+            "status": estado,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in cabeceras.items()],
+        })
+
+    async def _json(self, send, estado: int, cuerpo, cabeceras: Headers | None = None) -> None:
+        datos = json.dumps(cuerpo).encode()
+        cabeceras = cabeceras or Headers()
+        cabeceras["Content-Type"] = "application/json"
+        cabeceras["Content-Length"] = str(len(datos))
+        await self._empezar(send, estado, cabeceras)
+        await send({"type": "http.response.body", "body": datos})
+
+    async def _enviar_flujo(self, send, estado: int, cabeceras: Headers, iterador: Iterator[bytes]) -> None:
+        """Envía `iterador` pidiendo cada trozo al pool; si el cliente se va, se cierra."""
+        await self._empezar(send, estado, cabeceras)
+        try:
+            while True:
+                trozo = await self._siguiente(iterador)
+                if trozo is None:
+                    break
+                if trozo:
+                    await send({"type": "http.response.body", "body": trozo, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            cerrar = getattr(iterador, "close", None)
+            if cerrar is not None:
+                await asyncio.get_running_loop().run_in_executor(self.executor, cerrar)
+
+    # ------------------------------------------------------------------ endpoints
+
+    async def _listar(self, scope, receive, send):
+        usuario_id = self._autenticar(scope)
+
+        def _consultar():
+            archivos = ArchivoRepositorio.listar_metadatos(usuario_id)
+            return resp_schema_many.dump(archivos)
+        await self._json(send, 200, await self._en_hilo(_consultar))
+
+    async def _cifrar(self, scope, receive, send):
+        usuario_id = self._autenticar(scope)
+        cabeceras = self._cabeceras(scope)
+        tipo, opciones = parse_options_header(cabeceras.get("Content-Type"))
+        if tipo != "multipart/form-data" or "boundary" not in opciones:
+            raise _ErrorHttp(400, "Falta archivo")
+        limite = self.app.config.get("MAX_CONTENT_LENGTH")
+        with self.app.app_context():
+            ruta_temporal = ruta_temporal_subida()
+
+        # 1) Volcar la parte "archivo" a disco según llega, sin retener un hilo
+        decodificador = MultipartDecoder(opciones["boundary"].encode())
+        loop = asyncio.get_running_loop()
+        destino = None
+        nombre = tipo_mime = None
+        recibidos = 0
+        en_archivo = False
+        try:
+            while True:
+                evento = decodificador.next_event()
+                if isinstance(evento, NeedData):
+                    mensaje = await receive()
+                    if mensaje["type"] == "http.disconnect":
+                        raise _ErrorHttp(400, "Subida interrumpida")
+                    cuerpo = mensaje.get("body", b"")
+                    recibidos += len(cuerpo)
+                    if limite is not None and recibidos > limite:
+                        raise _ErrorHttp(413, "Archivo demasiado grande")
+                    decodificador.receive_data(cuerpo)
+                    if not mensaje.get("more_body", False):
+                        decodificador.receive_data(None)
+                elif isinstance(evento, File):
+                    en_archivo = evento.name == "archivo" and destino is None
+                    if en_archivo:
+                        nombre = evento.filename
+                        tipo_mime = parse_options_header(evento.headers.get("Content-Type"))[0] or None
+                        destino = await loop.run_in_executor(self.executor, open, ruta_temporal, "wb")
+                elif isinstance(evento, Data):
+                    if en_archivo and evento.data:
+                        await loop.run_in_executor(self.executor, destino.write, evento.data)
+                elif isinstance(evento, Epilogue):
+                    break
+                else:
+                    en_archivo = False
+            if destino is None:
+                raise _ErrorHttp(400, "Falta archivo")
+        except BaseException as e:
+            if destino is not None:
+                destino.close()
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+            if isinstance(e, ValueError):
+                raise _ErrorHttp(400, "Cuerpo multipart inválido")
+            raise
+        await loop.run_in_executor(self.executor, destino.close)
+
+        ip = (scope.get("client") or (None,))[0]
+        user_agent = cabeceras.get("User-Agent")
+        asincrono = parse_qs(scope.get("query_string", b"").decode()).get(
+            "asincrono", [str(self.app.config["FILE_ASYNC_UPLOADS"])]
+        )[0]
+
+        # 2a) Modo trabajo: el temporal ya está en disco, se encola tal cual
+        if asincrono.lower() in ("1", "true"):
+            trabajo = await self._en_hilo(lambda: trabajo_schema.dump(ArchivoServicio.cifrar_en_segundo_plano(
+                usuario_id, nombre, tipo_mime, ruta_temporal, ip, user_agent
+            )))
+            extra = Headers({"Location": f"/api/trabajos/{trabajo['id']}"})
+            return await self._json(send, 202, {"trabajo": trabajo}, extra)
+
+        # 2b) Cifrado en el pool (KDF + AES-GCM + escritura del blob)
+        def _cifrar_temporal():
+            try:
+                with open(ruta_temporal, "rb") as f:
+                    arch = ArchivoServicio.cifrar_y_guardar(usuario_id, nombre, tipo_mime, f, ip, user_agent)
+                return resp_schema.dump(arch)
+            finally:
+                os.remove(ruta_temporal)
+        try:
+            cuerpo = await self._en_hilo(_cifrar_temporal)
+        except ValueError as e:
+            raise _ErrorHttp(400, str(e))
+        await self._json(send, 201, cuerpo)
+
+    async def _descifrar(self, scope, receive, send, archivo_id: str):
+        usuario_id = self._autenticar(scope)
+        cabeceras = self._cabeceras(scope)
+
+        def _preparar():
+            # Claves y blob se preparan aquí, para fallar antes de empezar a responder
+            arch = ArchivoRepositorio.buscar_por_id(int(archivo_id))
+            if not arch or arch.propietario_id != usuario_id:
+                raise _ErrorHttp(404, "No encontrado o sin permiso")
+            salida = Headers({"Content-Type": arch.tipo_mime or "application/octet-stream"})
+            rango = ArchivoServicio.rango_solicitado(
+                arch, parse_range_header(cabeceras.get("Range")), cabeceras.get("If-Range")
+            )
+            if rango == "invalido":
+                salida["Content-Range"] = f"bytes */{arch.tamano_bytes}"
+                return 416, salida, iter(())
+            if rango is not None:
+                inicio, fin = rango
+                flujo = ArchivoServicio.descifrar_rango_en_flujo(arch, usuario_id, inicio, fin)
+                estado = 206
+                salida["Content-Range"] = f"bytes {inicio}-{fin - 1}/{arch.tamano_bytes}"
+                salida["Content-Length"] = str(fin - inicio)
+            else:
+                flujo = ArchivoServicio.descifrar_en_flujo(arch, usuario_id)
+                estado = 200
+                if arch.tamano_bytes is not None:
+                    salida["Content-Length"] = str(arch.tamano_bytes)
+            cabeceras_descarga(salida, arch.nombre_original)
+            if ArchivoServicio.admite_rangos(arch):
+                salida["Accept-Ranges"] = "bytes"
+                if arch.hash_verificacion:
+                    salida["ETag"] = f'"{arch.hash_verificacion}"'
+            return estado, salida, flujo
+
+        estado, salida, flujo = await self._en_hilo(_preparar)
+        await self._enviar_flujo(send, estado, salida, flujo)
+
+    async def _descargar_cifrado(self, scope, receive, send, archivo_id: str):
+        usuario_id = self._autenticar(scope)
+        pathsend = "http.response.pathsend" in (scope.get("extensions") or {})
+
+        def _preparar():
+            arch = ArchivoRepositorio.buscar_por_id(int(archivo_id))
+            if not arch or arch.propietario_id != usuario_id:
+                raise _ErrorHttp(404, "No encontrado o sin permiso")
+            salida = Headers({"Content-Type": "application/octet-stream"})
+            cabeceras_descarga(salida, f"{arch.nombre_original}.encrypted")
+            backend, ruta, _ = arch.ubicacion_blob()
+            if backend == "fs":
+                # Con proxy delante, que sea él quien lea el archivo
+                sendfile = cabecera_sendfile(ruta)
+                if sendfile:
+                    salida[sendfile[0]] = sendfile[1]
+                    salida["Content-Length"] = "0"
+                    return salida, None, iter(())
+                salida["Content-Length"] = str(os.path.getsize(ruta))
+                if pathsend:
+                    return salida, os.path.abspath(ruta), None
+            flujo = ArchivoServicio.abrir_cifrado(arch)
+            salida["Content-Length"] = str(flujo.seek(0, os.SEEK_END))
+            flujo.seek(0)
+
+            def _leer():
+                with flujo:
+                    yield from iter(lambda: flujo.read(TAMANO_LECTURA), b"")
+            return salida, None, _leer()
+
+        try:
+            salida, ruta, flujo = await self._en_hilo(_preparar)
+        except (FileNotFoundError, ValueError) as e:
+            raise _ErrorHttp(500, f"Error descargando archivo cifrado: {str(e)}")
+        if ruta is not None:
+            # Extensión ASGI pathsend: el servidor copia el archivo con sendfile()
+            await self._empezar(send, 200, salida)
+            return await send({"type": "http.response.pathsend", "path": ruta})
+        await self._enviar_flujo(send, 200, salida, flujo)
+
+def crear_app_asgi(app: Flask) -> ArchivosAsgi:
+    return ArchivosAsgi(app)
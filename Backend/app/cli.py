@@ -0,0 +1,56 @@
+import click
+from datetime import datetime, timedelta
+from flask import Flask
+
+def registrar_comandos(app: Flask) -> None:
+    """Comandos de mantenimiento: flask --app app.main almacenamiento|auditoria <comando>"""
+
+    @app.cli.group("almacenamiento")
+    def almacenamiento():
+        """Mantenimiento del almacenamiento de blobs cifrados"""
+
+    @almacenamiento.command("fragmentar")
+    @click.option("--lote", default=500, show_default=True, help="Rutas por transacción")
+    @click.option("--simular", is_flag=True, help="Sólo contar lo que se movería")
+    def fragmentar(lote: int, simular: bool):
+        """Mueve los blobs fs de la estructura plana a ab/cd/<id>.cifrado"""
+        from .services.storage_service import AlmacenamientoServicio
+        resumen = AlmacenamientoServicio.fragmentar_rutas_fs(tamano_lote=lote, simular=simular)
+        accion = "Se moverían" if simular else "Movidas"
+        click.echo(f"{accion} {resumen['rutas']} rutas ({resumen['filas']} filas actualizadas); "
+                   f"{resumen['faltantes']} rutas sin archivo en disco")
+
+    @almacenamiento.command("limpiar-subidas")
+    @click.option("--lote", default=100, show_default=True, help="Sesiones por transacción")
+    def limpiar_subidas(lote: int):
+        """Cancela las subidas por partes caducadas y borra sus partes del spool"""
+        from .services.upload_service import SubidaServicio
+        click.echo(f"Canceladas {SubidaServicio.limpiar_caducadas(tamano_lote=lote)} sesiones caducadas")
+
+    @app.cli.group("auditoria")
+    def auditoria():
+        """Particiones, retención y resúmenes de la auditoría"""
+
+    @auditoria.command("mantener")
+    @click.option("--meses", type=int, default=None, help="Meses que se conservan (por defecto AUDIT_RETENTION_MONTHS)")
+    @click.option("--archivo", default=None, help="Carpeta de archivado (por defecto AUDIT_ARCHIVE_PATH)")
+    @click.option("--lote", default=1000, show_default=True, help="Filas por transacción al borrar sin particiones")
+    def mantener(meses: int | None, archivo: str | None, lote: int):
+        """Crea las particiones próximas y retira (archivando si procede) los meses vencidos"""
+        from .services.audit_retention_service import RetencionAuditoriaServicio
+        creadas = RetencionAuditoriaServicio.preparar_particiones()
+        resumen = RetencionAuditoriaServicio.aplicar_retencion(meses, archivo, lote)
+        click.echo(f"Particiones creadas: {', '.join(creadas) or 'ninguna'}")
+        click.echo(f"Particiones retiradas: {', '.join(resumen['particiones']) or 'ninguna'}; "
+                   f"{resumen['filas']} filas borradas")
+        for ruta in resumen["archivos"]:
+            click.echo(f"Archivado en {ruta}")
+
+    @auditoria.command("recalcular-resumenes")
+    @click.option("--dias", default=1, show_default=True, help="Días hacia atrás (incluido hoy)")
+    def recalcular_resumenes(dias: int):
+        """Rehace los resúmenes por hora y día a partir de los registros que aún existen"""
+        from .repository.audit_rollup_repository import ResumenAuditoriaRepositorio
+        hasta = datetime.utcnow() + timedelta(days=1)
+        contados = ResumenAuditoriaRepositorio.recalcular(hasta - timedelta(days=dias), hasta)
+        click.echo(f"Resúmenes recalculados con {contados} registros")
@@ -19,6 +19,76 @@ def cargar_configuracion(app, config_name=None):
     )
 
     app.config["MASTER_SECRET"] = os.getenv("MASTER_SECRET", "cambia-esto")
-    app.config["FILE_STORAGE_BACKEND"] = os.getenv("FILE_STORAGE_BACKEND", "fs")  # Cambiar a fs por defecto
+    app.config["KEK_ROOT_SALT"] = os.getenv("KEK_ROOT_SALT", "5365637572655661756c744b454b7632")  # Hex; salt del estiramiento de MASTER_SECRET en la KEK raíz
+    app.config["FILE_STORAGE_BACKEND"] = os.getenv("FILE_STORAGE_BACKEND", "fs")  # fs | db_blob | s3
     app.config["FILE_STORAGE_PATH"] = os.getenv("FILE_STORAGE_PATH", "./app/data_archivos")  # Ruta absoluta
     app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", "52428800"))
+    app.config["FILE_CHUNK_SIZE"] = int(os.getenv("FILE_CHUNK_SIZE", "65536"))  # Texto plano por chunk AES-GCM
+    app.config["FILE_COMPRESSION"] = os.getenv("FILE_COMPRESSION", "false").lower() == "true"  # Comprimir (zlib) antes de cifrar si compensa
+    app.config["FILE_ASYNC_UPLOADS"] = os.getenv("FILE_ASYNC_UPLOADS", "false").lower() == "true"  # /cifrar responde 202 y cifra en un trabajo
+    app.config["UPLOAD_SPOOL_PATH"] = os.getenv("UPLOAD_SPOOL_PATH", os.path.join(app.config["FILE_STORAGE_PATH"], "_subidas"))  # Subidas pendientes de cifrar
+    app.config["UPLOAD_PART_SIZE"] = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))  # Subidas por partes: texto plano por parte (se redondea a chunks)
+    app.config["UPLOAD_SESSION_TTL_HOURS"] = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))  # Plazo para completar una sesión de subida
+    app.config["UPLOAD_SESSION_MAX_BYTES"] = int(os.getenv("UPLOAD_SESSION_MAX_BYTES", "0"))  # Tamaño máximo por sesión (0 = sin límite)
+    app.config["FILE_SENDFILE_HEADER"] = os.getenv("FILE_SENDFILE_HEADER", "")  # "" | X-Accel-Redirect | X-Sendfile: el proxy sirve los .cifrado
+    app.config["FILE_SENDFILE_PREFIX"] = os.getenv("FILE_SENDFILE_PREFIX", "/protegido")  # location interna de nginx que apunta a FILE_STORAGE_PATH
+    app.config["FILE_DEDUP"] = os.getenv("FILE_DEDUP", "false").lower() == "true"  # Reutilizar blobs idénticos del mismo propietario
+
+    # Backend s3 (AWS o compatible, p. ej. MinIO con S3_ENDPOINT_URL); requiere boto3
+    app.config["S3_BUCKET"] = os.getenv("S3_BUCKET", "")
+    app.config["S3_ENDPOINT_URL"] = os.getenv("S3_ENDPOINT_URL", "")
+    app.config["S3_REGION"] = os.getenv("S3_REGION", "")
+    app.config["S3_ACCESS_KEY_ID"] = os.getenv("S3_ACCESS_KEY_ID", "")
+    app.config["S3_SECRET_ACCESS_KEY"] = os.getenv("S3_SECRET_ACCESS_KEY", "")
+    app.config["S3_PREFIX"] = os.getenv("S3_PREFIX", "")
+    app.config["S3_PART_SIZE"] = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))  # Tamaño de parte multipart (mín. 5 MiB)
+    app.config["S3_WORKERS"] = int(os.getenv("S3_WORKERS", "4"))  # Partes subiendo en paralelo
+
+    # Cache de UEK desenvueltas (evita repetir Argon2 en cada petición); TTL 0 la desactiva
+    app.config["KEY_CACHE_TTL_SECONDS"] = int(os.getenv("KEY_CACHE_TTL_SECONDS", "300"))
+    app.config["KEY_CACHE_MAX_ENTRIES"] = int(os.getenv("KEY_CACHE_MAX_ENTRIES", "1024"))
+
+    # Derivaciones Argon2 simultáneas (32 MiB cada una; 0 = sin límite) y espera máxima en cola antes de responder 503
+    app.config["KDF_MAX_CONCURRENT"] = int(os.getenv("KDF_MAX_CONCURRENT", "4"))
+    app.config["KDF_QUEUE_TIMEOUT_SECONDS"] = float(os.getenv("KDF_QUEUE_TIMEOUT_SECONDS", "10"))
+
+    # Cache LRU de blobs cifrados de descarga frecuente (sólo texto cifrado); 0 la desactiva
+    app.config["BLOB_CACHE_MAX_BYTES"] = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    app.config["BLOB_CACHE_MAX_ENTRY_BYTES"] = int(os.getenv("BLOB_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))  # Blobs mayores no entran
+
+    # Auditoría por lotes: cola en memoria volcada por un hilo con INSERT multi-fila al llegar a
+    # AUDIT_BATCH_SIZE registros o cada AUDIT_FLUSH_INTERVAL_SECONDS. Con la cola llena (AUDIT_QUEUE_SIZE)
+    # AUDIT_OVERFLOW_POLICY decide: sincrono (escribe en línea), bloquear (espera AUDIT_OVERFLOW_WAIT_SECONDS) o descartar
+    app.config["AUDIT_ASYNC"] = os.getenv("AUDIT_ASYNC", "true").lower() in ("1", "true", "yes")
+    app.config["AUDIT_QUEUE_SIZE"] = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+    app.config["AUDIT_BATCH_SIZE"] = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+    app.config["AUDIT_FLUSH_INTERVAL_SECONDS"] = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+    app.config["AUDIT_OVERFLOW_POLICY"] = os.getenv("AUDIT_OVERFLOW_POLICY", "sincrono")
+    app.config["AUDIT_OVERFLOW_WAIT_SECONDS"] = float(os.getenv("AUDIT_OVERFLOW_WAIT_SECONDS", "1"))
+
+    # Retención de auditoría (flask auditoria mantener): meses completos que se conservan (0 = todos),
+    # carpeta donde se archivan los meses vencidos (.jsonl.gz; vacío = se borran sin archivar)
+    # y particiones mensuales que se crean por adelantado en PostgreSQL
+    app.config["AUDIT_RETENTION_MONTHS"] = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+    app.config["AUDIT_ARCHIVE_PATH"] = os.getenv("AUDIT_ARCHIVE_PATH", "")
+    app.config["AUDIT_PARTITIONS_AHEAD"] = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+
+    # Motor AES-GCM paralelo: hilos para sellar chunks (1 = secuencial) y chunks por tarea
+    app.config["CRYPTO_WORKERS"] = int(os.getenv("CRYPTO_WORKERS", str(os.cpu_count() or 1)))
+    app.config["CRYPTO_CHUNKS_POR_TAREA"] = int(os.getenv("CRYPTO_CHUNKS_POR_TAREA", "16"))
+
+    # Exportación ZIP: chunks descifrados por adelantado (0 = sin lectura anticipada) e hilos del pool
+    app.config["EXPORT_READAHEAD_CHUNKS"] = int(os.getenv("EXPORT_READAHEAD_CHUNKS", "8"))
+    app.config["EXPORT_READAHEAD_WORKERS"] = int(os.getenv("EXPORT_READAHEAD_WORKERS", "4"))
+
+    # Modo ASGI (asgi.py): hilos para DB, KDF y AES-GCM de los endpoints de archivos
+    app.config["ASGI_EXECUTOR_WORKERS"] = int(os.getenv("ASGI_EXECUTOR_WORKERS", "16"))
+
+    # Trabajos en segundo plano: hilos del pool y archivos por transacción al rotar claves
+    app.config["JOB_WORKERS"] = int(os.getenv("JOB_WORKERS", "2"))
+    app.config["KEY_ROTATION_BATCH_SIZE"] = int(os.getenv("KEY_ROTATION_BATCH_SIZE", "500"))
+    app.config["KEK_MIGRATION_BATCH_SIZE"] = int(os.getenv("KEK_MIGRATION_BATCH_SIZE", "50"))  # Claves por transacción al migrar a la jerarquía v2 (un Argon2 cada una)
+
+    # Migración db_blob -> fs: filas por transacción y límite de escritura (0 = sin límite)
+    app.config["STORAGE_MIGRATION_BATCH_SIZE"] = int(os.getenv("STORAGE_MIGRATION_BATCH_SIZE", "50"))
+    app.config["STORAGE_MIGRATION_MAX_BYTES_PER_SECOND"] = int(os.getenv("STORAGE_MIGRATION_MAX_BYTES_PER_SECOND", "0"))
@@ -0,0 +1,120 @@
+import io
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import BinaryIO, Callable, Iterator, Optional
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .aes_stream import iterar_chunks, nonce_para_chunk, TAMANO_CHUNK_DEFECTO, TAMANO_TAG
+
+# AESGCM libera el GIL mientras cifra, así que un pool de hilos reparte los
+# chunks entre núcleos. El formato de salida es idéntico al de aes_stream.
+
+_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+_workers = os.cpu_count() or 1
+_chunks_por_tarea = 16
+
+def configurar_motor_paralelo(workers: int | None = None, chunks_por_tarea: int | None = None) -> None:
+    """workers <= 1 desactiva el pool (las funciones caen al modo secuencial)."""
+    global _executor, _workers, _chunks_por_tarea
+    with _lock:
+        if workers is not None and workers != _workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+                _executor = None
+            _workers = max(1, workers)
+        if chunks_por_tarea is not None:
+            _chunks_por_tarea = max(1, chunks_por_tarea)
+
+def workers_configurados() -> int:
+    return _workers
+
+def _obtener_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="aes-gcm")
+        return _executor
+
+def _sellar_lote(clave: bytes, prefijo: bytes, lote: list[tuple[int, bytes, bool]], descifrar: bool) -> list[bytes]:
+    aesgcm = AESGCM(clave)
+    operacion = aesgcm.decrypt if descifrar else aesgcm.encrypt
+    return [operacion(nonce_para_chunk(prefijo, indice, ultimo), datos, None) for indice, datos, ultimo in lote]
+
+def _leidos(chunks: Iterator[tuple[int, bytes, bool]], al_leer: Callable[[bytes], None]) -> Iterator[tuple[int, bytes, bool]]:
+    for chunk in chunks:
+        al_leer(chunk[1])
+        yield chunk
+
+def _desplazados(chunks: Iterator[tuple[int, bytes, bool]], primer_indice: int, final: bool) -> Iterator[tuple[int, bytes, bool]]:
+    for indice, datos, ultimo in chunks:
+        yield primer_indice + indice, datos, ultimo and final
+
+def _procesar_en_orden(clave: bytes, prefijo: bytes, lector: BinaryIO, tamano_bloque: int,
+                       descifrar: bool, al_leer: Optional[Callable[[bytes], None]] = None,
+                       primer_indice: int = 0, final: bool = True) -> Iterator[bytes]:
+    """
+    Lee lotes de chunks en el hilo llamador, los sella en el pool y los devuelve
+    en el orden original. Como mucho hay 2 * workers lotes en vuelo, así que la
+    memoria queda acotada aunque el flujo sea enorme.
+    `al_leer` se invoca en el hilo llamador con cada chunk según se lee, en orden.
+    Con `primer_indice`/`final` el flujo es un tramo intermedio del archivo: los
+    índices empiezan en `primer_indice` y sólo se marca el último chunk si `final`.
+    """
+    chunks = iterar_chunks(lector, tamano_bloque)
+    if primer_indice or not final:
+        chunks = _desplazados(chunks, primer_indice, final)
+    if al_leer is not None:
+        chunks = _leidos(chunks, al_leer)
+    if _workers <= 1:
+        for lote in iter(lambda: list(islice(chunks, _chunks_por_tarea)), []):
+            yield from _sellar_lote(clave, prefijo, lote, descifrar)
+        return
+
+    executor = _obtener_executor()
+    en_vuelo: deque = deque()
+    max_en_vuelo = 2 * _workers
+    try:
+        while True:
+            while len(en_vuelo) < max_en_vuelo:
+                lote = list(islice(chunks, _chunks_por_tarea))
+                if not lote:
+                    break
+                en_vuelo.append(executor.submit(_sellar_lote, clave, prefijo, lote, descifrar))
+            if not en_vuelo:
+                return
+            yield from en_vuelo.popleft().result()
+    finally:
+        for futuro in en_vuelo:
+            futuro.cancel()
+
+def cifrar_flujo_paralelo(clave: bytes, prefijo: bytes, lector: BinaryIO,
+                          tamano_chunk: int = TAMANO_CHUNK_DEFECTO,
+                          al_leer: Optional[Callable[[bytes], None]] = None) -> Iterator[bytes]:
+    """Equivalente a aes_stream.cifrar_flujo repartiendo los chunks entre workers."""
+    return _procesar_en_orden(clave, prefijo, lector, tamano_chunk, descifrar=False, al_leer=al_leer)
+
+def cifrar_tramo_paralelo(clave: bytes, prefijo: bytes, lector: BinaryIO, tamano_chunk: int,
+                          primer_indice: int, final: bool) -> Iterator[bytes]:
+    """
+    Cifra un tramo del archivo que empieza en el chunk `primer_indice` (su texto
+    plano debe empezar en un límite de chunk). Concatenando en orden los tramos
+    se obtiene exactamente lo que produciría cifrar_flujo con el archivo entero.
+    """
+    return _procesar_en_orden(clave, prefijo, lector, tamano_chunk, descifrar=False,
+                              primer_indice=primer_indice, final=final)
+
+def descifrar_flujo_paralelo(clave: bytes, prefijo: bytes, lector: BinaryIO,
+                             tamano_chunk: int = TAMANO_CHUNK_DEFECTO) -> Iterator[bytes]:
+    """Equivalente a aes_stream.descifrar_flujo repartiendo los chunks entre workers."""
+    return _procesar_en_orden(clave, prefijo, lector, tamano_chunk + TAMANO_TAG, descifrar=True)
+
+def cifrar_paralelo(clave: bytes, prefijo: bytes, datos: bytes,
+                    tamano_chunk: int = TAMANO_CHUNK_DEFECTO) -> bytes:
+    return b"".join(cifrar_flujo_paralelo(clave, prefijo, io.BytesIO(datos), tamano_chunk))
+
+def descifrar_paralelo(clave: bytes, prefijo: bytes, datos: bytes,
+                       tamano_chunk: int = TAMANO_CHUNK_DEFECTO) -> bytes:
+    return b"".join(descifrar_flujo_paralelo(clave, prefijo, io.BytesIO(datos), tamano_chunk))
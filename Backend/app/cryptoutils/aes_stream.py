@@ -0,0 +1,101 @@
+from typing import BinaryIO, Callable, Iterator, Optional
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import os
+
+TAMANO_CHUNK_DEFECTO = 64 * 1024  # 64 KiB de texto plano por chunk
+TAMANO_TAG = 16
+TAMANO_PREFIJO_NONCE = 7
+MAX_CHUNKS = 2**32
+
+def generar_prefijo_nonce() -> bytes:
+    return os.urandom(TAMANO_PREFIJO_NONCE)
+
+def nonce_para_chunk(prefijo: bytes, indice: int, ultimo: bool) -> bytes:
+    """
+    Nonce de 96 bits para el chunk `indice` (construcción STREAM):
+    prefijo(7) || contador big-endian(4) || bandera_ultimo(1).
+    La bandera de último chunk impide truncar el archivo descartando chunks finales.
+    """
+    if indice >= MAX_CHUNKS:
+        raise ValueError("Demasiados chunks para un mismo prefijo de nonce")
+    return prefijo + indice.to_bytes(4, "big") + (b"\x01" if ultimo else b"\x00")
+
+def _leer_exacto(lector: BinaryIO, n: int) -> bytes:
+    """Lee hasta n bytes; sólo devuelve menos si el flujo se terminó."""
+    partes = []
+    faltan = n
+    while faltan > 0:
+        parte = lector.read(faltan)
+        if not parte:
+            break
+        partes.append(parte)
+        faltan -= len(parte)
+    return b"".join(partes)
+
+def iterar_chunks(lector: BinaryIO, tamano: int) -> Iterator[tuple[int, bytes, bool]]:
+    """
+    Parte el flujo en bloques de `tamano` bytes: (indice, datos, es_ultimo).
+    Lee un bloque por adelantado para saber cuál es el último; un flujo vacío
+    produce un único bloque vacío marcado como último.
+    """
+    indice = 0
+    actual = _leer_exacto(lector, tamano)
+    while True:
+        siguiente = _leer_exacto(lector, tamano) if len(actual) == tamano else b""
+        ultimo = not siguiente
+        yield indice, actual, ultimo
+        if ultimo:
+            return
+        actual = siguiente
+        indice += 1
+
+def cifrar_flujo(clave: bytes, prefijo: bytes, lector: BinaryIO,
+                 tamano_chunk: int = TAMANO_CHUNK_DEFECTO,
+                 al_leer: Optional[Callable[[bytes], None]] = None) -> Iterator[bytes]:
+    """
+    Cifra `lector` por chunks de `tamano_chunk` bytes.
+    Cada elemento devuelto es cifrado || tag(16) de un chunk; un flujo vacío
+    produce un único chunk final vacío (sólo tag).
+    `al_leer` recibe cada chunk en claro justo antes de cifrarlo.
+    """
+    aesgcm = AESGCM(clave)
+    for indice, datos, ultimo in iterar_chunks(lector, tamano_chunk):
+        if al_leer is not None:
+            al_leer(datos)
+        yield aesgcm.encrypt(nonce_para_chunk(prefijo, indice, ultimo), datos, None)
+
+def descifrar_flujo(clave: bytes, prefijo: bytes, lector: BinaryIO,
+                    tamano_chunk: int = TAMANO_CHUNK_DEFECTO) -> Iterator[bytes]:
+    """
+    Inverso de cifrar_flujo: verifica y descifra chunk por chunk.
+    Lanza InvalidTag si algún chunk fue alterado, reordenado o si falta el chunk final.
+    """
+    aesgcm = AESGCM(clave)
+    for indice, datos, ultimo in iterar_chunks(lector, tamano_chunk + TAMANO_TAG):
+        yield aesgcm.decrypt(nonce_para_chunk(prefijo, indice, ultimo), datos, None)
+
+def numero_de_chunks(tamano_total: int, tamano_chunk: int) -> int:
+    """Un archivo vacío ocupa igualmente un chunk (sólo tag)."""
+    return max(1, -(-tamano_total // tamano_chunk))
+
+def descifrar_rango(clave: bytes, prefijo: bytes, lector: BinaryIO, tamano_chunk: int,
+                    tamano_total: int, inicio: int, fin: int) -> Iterator[bytes]:
+    """
+    Descifra sólo los bytes [inicio, fin) del texto plano.
+    `lector` debe admitir seek: el chunk i empieza en i * (tamano_chunk + 16),
+    así que sólo se leen y verifican los chunks que cubren el rango.
+    """
+    if not 0 <= inicio <= fin <= tamano_total:
+        raise ValueError("Rango fuera del archivo")
+    if inicio == fin:
+        return
+    aesgcm = AESGCM(clave)
+    ultimo_indice = numero_de_chunks(tamano_total, tamano_chunk) - 1
+    tamano_cifrado = tamano_chunk + TAMANO_TAG
+    primero = inicio // tamano_chunk
+    lector.seek(primero * tamano_cifrado)
+    for indice in range(primero, (fin - 1) // tamano_chunk + 1):
+        cifrado = _leer_exacto(lector, tamano_cifrado)
+        datos = aesgcm.decrypt(nonce_para_chunk(prefijo, indice, indice == ultimo_indice), cifrado, None)
+        desplazamiento = indice * tamano_chunk
+        yield datos[max(inicio - desplazamiento, 0):fin - desplazamiento]
@@ -0,0 +1,65 @@
+import hashlib
+from typing import BinaryIO, Iterator, Optional
+from .aes_stream import TAMANO_CHUNK_DEFECTO, TAMANO_TAG, numero_de_chunks
+from .aes_parallel import cifrar_flujo_paralelo
+from ..utils.compression import LectorComprimido, CODEC_ZLIB
+
+class CifradoConHash:
+    """
+    Etapa única de hash + cifrado: cada chunk leído se pasa por SHA-256 y por
+    AES-GCM en la misma pasada, mientras sigue en caché.
+    Al iterar devuelve los chunks cifrados; al terminar quedan disponibles
+    hash_hex, tamano, tag (del chunk final) y chunks.
+    Funciona igual con bytes en memoria que con flujos de subida.
+    Con `compresion` el texto plano se comprime antes de cifrar; hash y tamano
+    siguen siendo los del texto plano y tamano_almacenado es lo que entra en AES-GCM.
+    """
+    def __init__(self, clave: bytes, prefijo: bytes, lector: BinaryIO,
+                 tamano_chunk: int = TAMANO_CHUNK_DEFECTO, compresion: Optional[str] = None):
+        if compresion not in (None, CODEC_ZLIB):
+            raise ValueError(f"Codec de compresión no soportado: {compresion}")
+        self._clave = clave
+        self._prefijo = prefijo
+        self._lector = lector
+        self.tamano_chunk = tamano_chunk
+        self.compresion = compresion
+        self._hash = hashlib.sha256()
+        self.tamano = 0
+        self.tamano_almacenado = 0
+        self.tag: bytes | None = None
+        self._terminado = False
+
+    def _al_leer(self, datos: bytes) -> None:
+        self._hash.update(datos)
+        self.tamano += len(datos)
+
+    def _al_cifrar(self, datos: bytes) -> None:
+        self.tamano_almacenado += len(datos)
+
+    def _al_leer_y_cifrar(self, datos: bytes) -> None:
+        self._al_leer(datos)
+        self._al_cifrar(datos)
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.compresion:
+            lector = LectorComprimido(self._lector, self.tamano_chunk, al_leer=self._al_leer)
+            al_cifrar = self._al_cifrar
+        else:
+            lector = self._lector
+            al_cifrar = self._al_leer_y_cifrar
+        cifrado = b""
+        for cifrado in cifrar_flujo_paralelo(self._clave, self._prefijo, lector,
+                                             self.tamano_chunk, al_leer=al_cifrar):
+            yield cifrado
+        self.tag = cifrado[-TAMANO_TAG:]
+        self._terminado = True
+
+    @property
+    def hash_hex(self) -> str:
+        if not self._terminado:
+            raise RuntimeError("El flujo aún no se ha consumido por completo")
+        return self._hash.hexdigest()
+
+    @property
+    def chunks(self) -> int:
+        return numero_de_chunks(self.tamano_almacenado, self.tamano_chunk)
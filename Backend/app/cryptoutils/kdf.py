@@ -1,6 +1,10 @@
 # app/cryptoutils/kdf.py
+import hashlib
 import os
-from typing import Tuple, Optional, Dict
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple, Optional, Dict
 
 # Intentamos Argon2id; si no está disponible, usamos Scrypt.
 try:
@@ -10,6 +14,101 @@ except Exception:
     _ARGON2_OK = False
 
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+
+# Jerarquía de claves:
+# - versión 1: KEK = Argon2id(MASTER_SECRET, kdf_salt de cada clave) en cada uso
+# - versión 2: KEK raíz = Argon2id(MASTER_SECRET, salt raíz) una vez por proceso;
+#              KEK de cada clave = HKDF-SHA256(KEK raíz, kdf_salt)
+VERSION_JERARQUIA = 2
+_INFO_HKDF = b"securevault/kek/v2"
+
+class KdfSaturado(RuntimeError):
+    """No quedó hueco para derivar una clave dentro del tiempo de espera configurado"""
+    def __init__(self, reintentar_en: int):
+        super().__init__("Servicio de cifrado saturado, reintente en unos segundos")
+        self.reintentar_en = reintentar_en
+
+class LimitadorKdf:
+    """
+    Acota cuántas derivaciones Argon2/Scrypt corren a la vez: cada una reserva
+    `memory_cost` de memoria, así que el pico queda en max_concurrentes * 32 MiB.
+    Las que no caben esperan en cola hasta timeout_segundos y después fallan
+    con KdfSaturado. max_concurrentes <= 0 desactiva el límite.
+    """
+    def __init__(self, max_concurrentes: int = 4, timeout_segundos: float = 10):
+        self._cond = threading.Condition()
+        self.en_curso = 0
+        self.en_cola = 0
+        self._max_en_cola = 0
+        self._derivaciones = 0
+        self._rechazadas = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self.configurar(max_concurrentes, timeout_segundos)
+
+    def configurar(self, max_concurrentes: int, timeout_segundos: float) -> None:
+        with self._cond:
+            self.max_concurrentes = max_concurrentes
+            self.timeout_segundos = timeout_segundos
+            self._cond.notify_all()
+
+    def _hay_hueco(self) -> bool:
+        return self.max_concurrentes <= 0 or self.en_curso < self.max_concurrentes
+
+    @contextmanager
+    def turno(self) -> Iterator[None]:
+        inicio = time.monotonic()
+        with self._cond:
+            self.en_cola += 1
+            self._max_en_cola = max(self._max_en_cola, self.en_cola)
+            try:
+                concedido = self._cond.wait_for(self._hay_hueco, timeout=self.timeout_segundos)
+            finally:
+                self.en_cola -= 1
+            espera = time.monotonic() - inicio
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+            if not concedido:
+                self._rechazadas += 1
+                raise KdfSaturado(reintentar_en=max(1, round(self.timeout_segundos)))
+            self.en_curso += 1
+            self._derivaciones += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.en_curso -= 1
+                self._cond.notify()
+
+    def metricas(self) -> dict:
+        with self._cond:
+            solicitudes = self._derivaciones + self._rechazadas
+            return {
+                "max_concurrentes": self.max_concurrentes,
+                "en_curso": self.en_curso,
+                "en_cola": self.en_cola,
+                "max_en_cola": self._max_en_cola,
+                "derivaciones": self._derivaciones,
+                "rechazadas": self._rechazadas,
+                "espera_media_ms": round(1000 * self._espera_total / solicitudes, 2) if solicitudes else 0.0,
+                "espera_max_ms": round(1000 * self._espera_max, 2),
+            }
+
+# Instancia compartida por el proceso (se configura en crear_app)
+limitador_kdf = LimitadorKdf()
+
+def parametros_defecto() -> Dict:
+    """Parámetros del KDF para claves nuevas (Argon2id si está disponible, si no Scrypt)."""
+    if _ARGON2_OK:
+        return {
+            "time_cost": 3,
+            "memory_cost": 2**15,  # 32 MiB
+            "parallelism": 2,
+            "hash_len": 32
+        }
+    return {"n": 2**14, "r": 8, "p": 1, "length": 32}
 
 def derivar_kek(master: bytes,
                 salt: Optional[bytes] = None,
@@ -18,19 +117,15 @@ def derivar_kek(master: bytes,
     Deriva una KEK (Key Encryption Key) desde MASTER_SECRET.
     - Usa Argon2id si está disponible (cryptography con soporte Argon2).
     - Si no, cae a Scrypt (portátil y estable).
+    - Como mucho `limitador_kdf.max_concurrentes` derivaciones a la vez (KdfSaturado si no hay turno).
     Retorna: (kek, salt, params_usados)
     """
     if salt is None:
         salt = os.urandom(16)
+    if params is None:
+        params = parametros_defecto()
 
     if _ARGON2_OK:
-        if params is None:
-            params = {
-                "time_cost": 3,
-                "memory_cost": 2**15,  # 32 MiB
-                "parallelism": 2,
-                "hash_len": 32
-            }
         # Usar los parámetros requeridos por la versión actual de cryptography
         kdf = Argon2id(
             iterations=params["time_cost"],     # Requerido como posicional
@@ -39,11 +134,10 @@ def derivar_kek(master: bytes,
             length=params["hash_len"],
             salt=salt,
         )
-        kek = kdf.derive(master)
+        with limitador_kdf.turno():
+            kek = kdf.derive(master)
         return kek, salt, params
     else:
-        if params is None:
-            params = {"n": 2**14, "r": 8, "p": 1, "length": 32}
         kdf = Scrypt(
             salt=salt,
             length=params["length"],
@@ -51,5 +145,32 @@ def derivar_kek(master: bytes,
             r=params["r"],
             p=params["p"],
         )
-        kek = kdf.derive(master)
+        with limitador_kdf.turno():
+            kek = kdf.derive(master)
         return kek, salt, params
+
+_lock_raices = threading.Lock()
+_raices: Dict[tuple, bytes] = {}
+
+def _clave_raiz(master: bytes, salt: bytes, params: Dict) -> tuple:
+    return hashlib.sha256(master).digest(), salt, tuple(sorted(params.items()))
+
+def kek_raiz(master: bytes, salt: bytes, params: Optional[Dict] = None) -> Tuple[bytes, Dict]:
+    """
+    KEK raíz: MASTER_SECRET estirado con Argon2id (o Scrypt) una sola vez por
+    proceso y combinación (salt, params). Devuelve (kek_raiz, params_usados).
+    """
+    if params is None:
+        params = parametros_defecto()
+    clave = _clave_raiz(master, salt, params)
+    with _lock_raices:
+        raiz = _raices.get(clave)
+        if raiz is None:
+            # Bajo el lock: peticiones simultáneas al arrancar no repiten el estiramiento
+            raiz, _, _ = derivar_kek(master, salt=salt, params=params)
+            _raices[clave] = raiz
+        return raiz, params
+
+def derivar_kek_hija(raiz: bytes, salt: bytes) -> bytes:
+    """KEK de una clave (versión 2): HKDF-SHA256 de la KEK raíz con el salt de la clave; microsegundos."""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=_INFO_HKDF).derive(raiz)
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+def _borrar(valor: bytearray) -> None:
+    """Sobrescribe con ceros el material de clave antes de soltarlo."""
+    valor[:] = bytes(len(valor))
+
+class CacheClaves:
+    """
+    Cache en proceso de claves desenvueltas (UEK), indexada por ClaveCifradoUsuario.id.
+    - Expiración por TTL y límite de entradas con desalojo LRU.
+    - Las entradas desalojadas o invalidadas se ponen a cero.
+    - ttl_segundos <= 0 o max_entradas <= 0 desactiva la cache.
+    """
+    def __init__(self, ttl_segundos: float = 300, max_entradas: int = 1024):
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[int, tuple[float, bytearray]]" = OrderedDict()
+        self.configurar(ttl_segundos, max_entradas)
+
+    def configurar(self, ttl_segundos: float, max_entradas: int) -> None:
+        with self._lock:
+            self.ttl_segundos = ttl_segundos
+            self.max_entradas = max_entradas
+            self._recortar()
+
+    @property
+    def activa(self) -> bool:
+        return self.ttl_segundos > 0 and self.max_entradas > 0
+
+    def obtener(self, clave_id: int) -> Optional[bytes]:
+        with self._lock:
+            entrada = self._entradas.get(clave_id)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                _borrar(self._entradas.pop(clave_id)[1])
+                return None
+            self._entradas.move_to_end(clave_id)
+            return bytes(valor)
+
+    def guardar(self, clave_id: int, valor: bytes) -> None:
+        if not self.activa:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave_id, None)
+            if anterior is not None:
+                _borrar(anterior[1])
+            self._entradas[clave_id] = (time.monotonic() + self.ttl_segundos, bytearray(valor))
+            self._recortar()
+
+    def invalidar(self, clave_ids: Iterable[int]) -> None:
+        with self._lock:
+            for clave_id in clave_ids:
+                entrada = self._entradas.pop(clave_id, None)
+                if entrada is not None:
+                    _borrar(entrada[1])
+
+    def limpiar(self) -> None:
+        with self._lock:
+            while self._entradas:
+                _borrar(self._entradas.popitem()[1][1])
+
+    def _recortar(self) -> None:
+        # Llamar con el lock tomado
+        limite = max(self.max_entradas, 0) if self.activa else 0
+        while len(self._entradas) > limite:
+            _borrar(self._entradas.popitem(last=False)[1][1])
+
+# Instancia compartida por el proceso (se configura en crear_app)
+cache_uek = CacheClaves()
@@ -10,5 +10,5 @@ db = SQLAlchemy()
 migrate = Migrate()
 bcrypt = Bcrypt()
 jwt = JWTManager()
-cors = CORS(resources={r"/api/*": {"origins": "*"}})
+cors = CORS(resources={r"/api/*": {"origins": "*", "expose_headers": ["X-Cursor-Siguiente"]}})
 limiter = Limiter(key_func=get_remote_address)
@@ -3,5 +3,9 @@ from .role import Rol
 from .auth import TokenRefresco, JWTListaNegra
 from .encryption_key import ClaveCifradoUsuario
 from .file import Archivo
+from .blob_ref import BlobCompartido
 from .file_share import ArchivoCompartido
 from .audit_log import RegistroAuditoria
+from .job import Trabajo
+from .upload_session import SesionSubida
+from .audit_rollup import ResumenAuditoria
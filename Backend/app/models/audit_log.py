@@ -2,7 +2,17 @@ from datetime import datetime
 from ..extensions import db
 
 class RegistroAuditoria(db.Model):
+    # En PostgreSQL la tabla está particionada por meses de creado_en y su clave
+    # primaria real es (id, creado_en); id sigue siendo único (una sola secuencia)
     __tablename__ = "registros_auditoria"
+    # Uno por combinación de filtros de /api/admin/auditoria, todos terminando
+    # en el orden de la paginación por clave (creado_en, id)
+    __table_args__ = (
+        db.Index("ix_registros_auditoria_creado_en_id", "creado_en", "id"),
+        db.Index("ix_registros_auditoria_accion_creado_en_id", "accion", "creado_en", "id"),
+        db.Index("ix_registros_auditoria_estado_creado_en_id", "estado", "creado_en", "id"),
+        db.Index("ix_registros_auditoria_accion_estado_creado_en_id", "accion", "estado", "creado_en", "id"),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True)
     actor_usuario_id = db.Column(db.BigInteger, db.ForeignKey("usuarios.id"), nullable=True, index=True)
@@ -0,0 +1,21 @@
+from ..extensions import db
+
+class ResumenAuditoria(db.Model):
+    """
+    Registros de auditoría contados por periodo (inicio de la hora o del día),
+    acción, estado y usuario. Se mantienen al escribir la auditoría y sobreviven
+    a la retención de registros_auditoria.
+    """
+    __tablename__ = "resumenes_auditoria"
+    __table_args__ = (
+        db.UniqueConstraint("granularidad", "periodo", "accion", "estado", "actor_usuario_id",
+                            name="uq_resumenes_auditoria_clave"),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    granularidad = db.Column(db.String(10), nullable=False)  # hora | dia
+    periodo = db.Column(db.DateTime, nullable=False)
+    accion = db.Column(db.String(50), nullable=False)
+    estado = db.Column(db.String(20), nullable=False)
+    actor_usuario_id = db.Column(db.BigInteger, nullable=False, default=0)  # 0 = sin usuario (sistema)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,16 @@
+from datetime import datetime
+from sqlalchemy.orm import deferred
+from ..extensions import db
+
+class BlobCompartido(db.Model):
+    """Blob cifrado referenciado por varios Archivo del mismo propietario (deduplicación)"""
+    __tablename__ = "blobs_compartidos"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    propietario_id = db.Column(db.BigInteger, db.ForeignKey("usuarios.id"), index=True, nullable=False)
+    hash_verificacion = db.Column(db.String(128), nullable=False)
+    backend_almacenamiento = db.Column(db.String(20), nullable=False, default="db_blob")  # db_blob | fs | s3
+    ruta_almacenamiento = db.Column(db.String(500), nullable=True)
+    blob_cifrado = deferred(db.Column(db.LargeBinary, nullable=True))  # Diferida, como en Archivo
+    referencias = db.Column(db.Integer, nullable=False, default=1)  # Archivo que apuntan a este blob
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
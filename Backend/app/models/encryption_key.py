@@ -8,7 +8,7 @@ class ClaveCifradoUsuario(db.Model):
     usuario_id = db.Column(db.BigInteger, db.ForeignKey("usuarios.id"), index=True, nullable=False)
     etiqueta = db.Column(db.String(100), nullable=False)
     uek_envuelta = db.Column(db.LargeBinary, nullable=False)  # UEK cifrada con KEK (derivada de MASTER_SECRET)
-    kdf = db.Column(db.String(50), nullable=False, default="argon2id")
+    kdf = db.Column(db.String(50), nullable=False, default="argon2id")  # argon2id (v1) | argon2id+hkdf (v2, ver kdf_parametros["version"])
     kdf_salt = db.Column(db.LargeBinary, nullable=True)
     kdf_parametros = db.Column(db.JSON, nullable=True)
     activa = db.Column(db.Boolean, default=True, nullable=False)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy.orm import deferred
 from ..extensions import db
 
 class Archivo(db.Model):
@@ -10,11 +11,13 @@ class Archivo(db.Model):
     tipo_mime = db.Column(db.String(120), nullable=True)
     tamano_bytes = db.Column(db.BigInteger, nullable=True)
 
-    backend_almacenamiento = db.Column(db.String(20), nullable=False, default="db_blob")  # db_blob | fs
+    backend_almacenamiento = db.Column(db.String(20), nullable=False, default="db_blob")  # db_blob | fs | s3
     ruta_almacenamiento = db.Column(db.String(500), nullable=True)
-    blob_cifrado = db.Column(db.LargeBinary, nullable=True)
+    blob_cifrado = deferred(db.Column(db.LargeBinary, nullable=True))  # Diferida: sólo se carga al descargar
+    blob_compartido_id = db.Column(db.BigInteger, db.ForeignKey("blobs_compartidos.id"), index=True, nullable=True)  # Deduplicación
 
-    dek_envuelta = db.Column(db.LargeBinary, nullable=False)  # DEK envuelta con UEK activa
+    dek_envuelta = db.Column(db.LargeBinary, nullable=False)  # DEK envuelta con la UEK `clave_id`
+    clave_id = db.Column(db.BigInteger, db.ForeignKey("claves_cifrado_usuarios.id"), index=True, nullable=True)  # NULL: UEK activa (archivos antiguos)
     cifrado = db.Column(db.String(50), nullable=False, default="AES-256-GCM")
     nonce = db.Column(db.LargeBinary, nullable=False)
     tag = db.Column(db.LargeBinary, nullable=False)
@@ -25,3 +28,15 @@ class Archivo(db.Model):
     actualizado_en = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     propietario = db.relationship("Usuario", backref="archivos", lazy=True)
+    blob_compartido = db.relationship("BlobCompartido", lazy=True)
+
+    __table_args__ = (
+        db.Index("ix_archivos_propietario_hash", "propietario_id", "hash_verificacion"),
+    )
+
+    def ubicacion_blob(self) -> tuple[str, str | None, bytes | None]:
+        """(backend, ruta, blob) donde está realmente el contenido cifrado"""
+        fuente = self.blob_compartido or self
+        # Acceder a blob_cifrado dispara su carga diferida: sólo cuando los bytes están en la fila
+        blob = fuente.blob_cifrado if fuente.backend_almacenamiento in (None, "db_blob") else None
+        return fuente.backend_almacenamiento, fuente.ruta_almacenamiento, blob
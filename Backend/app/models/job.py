@@ -0,0 +1,20 @@
+from datetime import datetime
+from ..extensions import db
+
+class Trabajo(db.Model):
+    """Tarea de fondo con progreso persistido, reanudable desde `cursor`"""
+    __tablename__ = "trabajos"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False, index=True)
+    usuario_id = db.Column(db.BigInteger, db.ForeignKey("usuarios.id"), index=True, nullable=True)
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente | en_curso | completado | fallido
+    procesados = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    cursor = db.Column(db.BigInteger, nullable=True)  # Último id procesado
+    parametros = db.Column(db.JSON, nullable=True)
+    resultado = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    actualizado_en = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    terminado_en = db.Column(db.DateTime, nullable=True)
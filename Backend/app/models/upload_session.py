@@ -0,0 +1,36 @@
+from datetime import datetime
+from ..extensions import db
+
+class SesionSubida(db.Model):
+    """
+    Subida reanudable por partes. Cada parte llega cifrada al vuelo con la DEK de
+    la sesión y se guarda en el spool; al completar se consolidan en un Archivo.
+    """
+    __tablename__ = "sesiones_subida"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    propietario_id = db.Column(db.BigInteger, db.ForeignKey("usuarios.id"), index=True, nullable=False)
+    nombre_original = db.Column(db.String(255), nullable=False)
+    tipo_mime = db.Column(db.String(120), nullable=True)
+    tamano_total = db.Column(db.BigInteger, nullable=False)
+    tamano_parte = db.Column(db.BigInteger, nullable=False)  # Múltiplo de tamano_chunk
+    tamano_chunk = db.Column(db.Integer, nullable=False)
+
+    dek_envuelta = db.Column(db.LargeBinary, nullable=False)  # DEK envuelta con la UEK `clave_id`
+    clave_id = db.Column(db.BigInteger, db.ForeignKey("claves_cifrado_usuarios.id"), nullable=False)
+    nonce = db.Column(db.LargeBinary, nullable=False)  # Prefijo STREAM común a todas las partes
+
+    estado = db.Column(db.String(20), nullable=False, default="abierta")  # abierta | completando | completada | cancelada
+    trabajo_id = db.Column(db.BigInteger, db.ForeignKey("trabajos.id"), nullable=True)
+    archivo_id = db.Column(db.BigInteger, db.ForeignKey("archivos.id", ondelete="SET NULL"), nullable=True)
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+    @property
+    def partes(self) -> int:
+        """Número de partes; un archivo vacío se sube igualmente como una parte vacía."""
+        return max(1, -(-self.tamano_total // self.tamano_parte))
+
+    def tamano_de_parte(self, numero: int) -> int:
+        """Bytes de texto plano que debe traer la parte `numero` (la última puede ser menor)."""
+        return min(self.tamano_parte, self.tamano_total - numero * self.tamano_parte)
@@ -1,9 +1,191 @@
+import re
+from datetime import date, datetime
+from typing import Iterator
+from sqlalchemy import text, tuple_
 from ..extensions import db
 from ..models.audit_log import RegistroAuditoria
+from ..utils.audit_sink import sumidero_auditoria
+from .audit_rollup_repository import ResumenAuditoriaRepositorio, contar
+
+TABLA = RegistroAuditoria.__tablename__
+DEFECTO = f"{TABLA}_pdefecto"
+_PATRON_PARTICION = re.compile(rf"^{TABLA}_p(\d{{4}})(\d{{2}})$")
+
+def nombre_particion(mes: date) -> str:
+    return f"{TABLA}_p{mes.year:04d}{mes.month:02d}"
+
+def mes_siguiente(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
 
 class AuditoriaRepositorio:
     @staticmethod
     def registrar(registro: RegistroAuditoria) -> RegistroAuditoria:
+        """Escritura durable: el registro se confirma junto con lo que haya pendiente en la sesión."""
         db.session.add(registro)
         db.session.commit()
         return registro
+
+    @staticmethod
+    def encolar(registro: RegistroAuditoria) -> None:
+        """Escritura diferida: el registro se inserta en el próximo lote del sumidero de auditoría."""
+        sumidero_auditoria.encolar(registro)
+
+    @staticmethod
+    def insertar_lote(filas: list[dict]) -> None:
+        """Un INSERT multi-fila y sus resúmenes, sin commit"""
+        db.session.execute(RegistroAuditoria.__table__.insert(), filas)
+        ResumenAuditoriaRepositorio.acumular(contar(filas))
+
+    @staticmethod
+    def pagina(limite: int, despues_de: tuple[datetime, int] | None = None, accion: str | None = None,
+               estado: str | None = None, desde: datetime | None = None, hasta: datetime | None = None,
+               ) -> tuple[list[RegistroAuditoria], tuple[datetime, int] | None]:
+        """
+        Página de registros por (creado_en, id) descendente, empezando justo
+        después de `despues_de` (paginación por clave: cada página cuesta lo
+        mismo sin importar lo profunda que sea). Devuelve (registros, clave
+        de la siguiente página o None si no hay más).
+        """
+        query = RegistroAuditoria.query
+        if accion:
+            query = query.filter(RegistroAuditoria.accion == accion)
+        if estado:
+            query = query.filter(RegistroAuditoria.estado == estado)
+        if desde:
+            query = query.filter(RegistroAuditoria.creado_en >= desde)
+        if hasta:
+            query = query.filter(RegistroAuditoria.creado_en <= hasta)
+        if despues_de:
+            query = query.filter(tuple_(RegistroAuditoria.creado_en, RegistroAuditoria.id) < tuple_(*despues_de))
+        registros = query.order_by(
+            RegistroAuditoria.creado_en.desc(), RegistroAuditoria.id.desc()
+        ).limit(limite + 1).all()
+        if len(registros) <= limite:
+            return registros, None
+        registros = registros[:limite]
+        return registros, (registros[-1].creado_en, registros[-1].id)
+
+    @staticmethod
+    def recientes(limite: int, desde: datetime | None = None, **filtros) -> list[RegistroAuditoria]:
+        """
+        Los `limite` registros más nuevos con `filtros` (igualdad por columna).
+        Primero sólo desde `desde` (por defecto el inicio del mes anterior: dos
+        particiones); si no llegan a `limite`, se completa con el histórico.
+        """
+        if desde is None:
+            hoy = datetime.utcnow()
+            desde = datetime(hoy.year - (hoy.month == 1), (hoy.month - 2) % 12 + 1, 1)
+        query = RegistroAuditoria.query.filter_by(**filtros).order_by(
+            RegistroAuditoria.creado_en.desc(), RegistroAuditoria.id.desc()
+        )
+        registros = query.filter(RegistroAuditoria.creado_en >= desde).limit(limite).all()
+        if len(registros) < limite:
+            registros += query.filter(RegistroAuditoria.creado_en < desde).limit(limite - len(registros)).all()
+        return registros
+
+    # ---- Particiones mensuales (sólo PostgreSQL; ver migración 9b4e1f7a2c63)
+
+    @staticmethod
+    def particionada() -> bool:
+        if db.session.get_bind().dialect.name != "postgresql":
+            return False
+        return db.session.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:tabla)"
+        ), {"tabla": TABLA}).first() is not None
+
+    @staticmethod
+    def particiones_mensuales() -> dict[date, bool]:
+        """Tablas de partición mensual existentes -> si siguen enganchadas a registros_auditoria"""
+        filas = db.session.execute(text(
+            "SELECT c.relname, i.inhparent IS NOT NULL FROM pg_class c "
+            "LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = to_regclass(:tabla) "
+            "WHERE c.relkind = 'r' AND c.relname LIKE :patron"
+        ), {"tabla": TABLA, "patron": f"{TABLA}_p%"}).all()
+        particiones = {}
+        for nombre, enganchada in filas:
+            m = _PATRON_PARTICION.match(nombre)
+            if m:
+                particiones[date(int(m.group(1)), int(m.group(2)), 1)] = enganchada
+        return particiones
+
+    @staticmethod
+    def crear_particion(mes: date) -> None:
+        """
+        Partición de `mes` (sin commit). Si ya había filas de ese mes en la
+        partición por defecto, se mueven a la nueva en la misma transacción.
+        """
+        nombre, desde, hasta = nombre_particion(mes), mes.isoformat(), mes_siguiente(mes).isoformat()
+        rango = {"desde": desde, "hasta": hasta}
+        huerfanas = db.session.execute(text(
+            f"SELECT 1 FROM {DEFECTO} WHERE creado_en >= :desde AND creado_en < :hasta LIMIT 1"
+        ), rango).first() is not None
+        if huerfanas:
+            db.session.execute(text(f"ALTER TABLE {TABLA} DETACH PARTITION {DEFECTO}"))
+        db.session.execute(text(
+            f"CREATE TABLE {nombre} PARTITION OF {TABLA} FOR VALUES FROM ('{desde}') TO ('{hasta}')"
+        ))
+        if huerfanas:
+            db.session.execute(text(
+                f"INSERT INTO {TABLA} SELECT * FROM {DEFECTO} WHERE creado_en >= :desde AND creado_en < :hasta"
+            ), rango)
+            db.session.execute(text(f"DELETE FROM {DEFECTO} WHERE creado_en >= :desde AND creado_en < :hasta"), rango)
+            db.session.execute(text(f"ALTER TABLE {TABLA} ATTACH PARTITION {DEFECTO} DEFAULT"))
+
+    @staticmethod
+    def separar_particion(mes: date) -> None:
+        """Desengancha la partición de `mes`: deja de verse en registros_auditoria (sin commit)"""
+        db.session.execute(text(f"ALTER TABLE {TABLA} DETACH PARTITION {nombre_particion(mes)}"))
+
+    @staticmethod
+    def eliminar_particion(mes: date) -> None:
+        db.session.execute(text(f"DROP TABLE {nombre_particion(mes)}"))
+
+    @staticmethod
+    def leer_particion(mes: date, tamano_lote: int = 1000) -> Iterator[dict]:
+        resultado = db.session.execute(
+            text(f"SELECT * FROM {nombre_particion(mes)} ORDER BY id"),
+            execution_options={"yield_per": tamano_lote},
+        )
+        for fila in resultado.mappings():
+            yield dict(fila)
+
+    # ---- Retención por filas (SQLite, o lo que quede en la partición por defecto)
+
+    @staticmethod
+    def primer_mes_antes_de(corte: datetime) -> date | None:
+        minimo = db.session.query(db.func.min(RegistroAuditoria.creado_en)).filter(
+            RegistroAuditoria.creado_en < corte
+        ).scalar()
+        if minimo is None:
+            return None
+        if isinstance(minimo, str):
+            minimo = datetime.fromisoformat(minimo)
+        return date(minimo.year, minimo.month, 1)
+
+    @staticmethod
+    def leer_entre(desde: datetime, hasta: datetime, tamano_lote: int = 1000) -> Iterator[dict]:
+        columnas = RegistroAuditoria.__table__.columns
+        resultado = db.session.execute(
+            db.select(*columnas).where(
+                RegistroAuditoria.creado_en >= desde, RegistroAuditoria.creado_en < hasta
+            ).order_by(RegistroAuditoria.id),
+            execution_options={"yield_per": tamano_lote},
+        )
+        for fila in resultado.mappings():
+            yield dict(fila)
+
+    @staticmethod
+    def eliminar_entre(desde: datetime, hasta: datetime, hasta_id: int, limite: int) -> int:
+        """Borra hasta `limite` registros de [desde, hasta) con id <= hasta_id; devuelve cuántos (sin commit)"""
+        ids = [i for i, in db.session.query(RegistroAuditoria.id).filter(
+            RegistroAuditoria.creado_en >= desde,
+            RegistroAuditoria.creado_en < hasta,
+            RegistroAuditoria.id <= hasta_id,
+        ).limit(limite)]
+        if not ids:
+            return 0
+        return RegistroAuditoria.query.filter(
+            RegistroAuditoria.id.in_(ids),
+            RegistroAuditoria.creado_en >= desde,
+            RegistroAuditoria.creado_en < hasta,
+        ).delete(synchronize_session=False)
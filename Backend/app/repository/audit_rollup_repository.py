@@ -0,0 +1,122 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from ..extensions import db
+from ..models.audit_log import RegistroAuditoria
+from ..models.audit_rollup import ResumenAuditoria
+
+GRANULARIDADES = ("hora", "dia")
+
+def truncar(momento: datetime, granularidad: str) -> datetime:
+    momento = momento.replace(minute=0, second=0, microsecond=0)
+    return momento.replace(hour=0) if granularidad == "dia" else momento
+
+def contar(filas: Iterable[dict]) -> Counter:
+    """Conteos por (hora, acción, estado, usuario) de filas con las columnas de registros_auditoria"""
+    return Counter(
+        (truncar(f["creado_en"], "hora"), f["accion"], f["estado"] or "SUCCESS", f["actor_usuario_id"] or 0)
+        for f in filas
+    )
+
+def _upsert(conexion, valores: list[dict]) -> None:
+    tabla = ResumenAuditoria.__table__
+    dialecto = conexion.dialect.name
+    if dialecto in ("postgresql", "sqlite"):
+        if dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        sentencia = insert(tabla)
+        conexion.execute(sentencia.on_conflict_do_update(
+            index_elements=["granularidad", "periodo", "accion", "estado", "actor_usuario_id"],
+            set_={"total": tabla.c.total + sentencia.excluded.total},
+        ), valores)
+        return
+    # Otros motores: actualizar y, si no había fila, insertar
+    for v in valores:
+        clave = [tabla.c[k] == v[k] for k in ("granularidad", "periodo", "accion", "estado", "actor_usuario_id")]
+        if conexion.execute(tabla.update().where(*clave).values(total=tabla.c.total + v["total"])).rowcount == 0:
+            conexion.execute(tabla.insert(), [v])
+
+class ResumenAuditoriaRepositorio:
+    @staticmethod
+    def acumular(conteos: Counter, conexion=None) -> None:
+        """Suma `conteos` (ver contar) a los resúmenes por hora y por día, sin commit"""
+        if not conteos:
+            return
+        por_periodo: Counter = Counter()
+        for (hora, accion, estado, actor), n in conteos.items():
+            for granularidad in GRANULARIDADES:
+                por_periodo[(granularidad, truncar(hora, granularidad), accion, estado, actor)] += n
+        valores = [
+            {"granularidad": g, "periodo": p, "accion": a, "estado": e, "actor_usuario_id": u, "total": n}
+            for (g, p, a, e, u), n in sorted(por_periodo.items())
+        ]
+        _upsert(conexion if conexion is not None else db.session.connection(), valores)
+
+    @staticmethod
+    def recalcular(desde: datetime, hasta: datetime) -> int:
+        """
+        Rehace los resúmenes de [desde, hasta) (ajustado a días completos) a
+        partir de registros_auditoria; sirve para rellenar o reparar. Devuelve
+        cuántos registros se contaron. Con commit.
+        """
+        desde, hasta = truncar(desde, "dia"), truncar(hasta, "dia")
+        if hasta <= desde:
+            hasta = desde + timedelta(days=1)
+        ResumenAuditoria.query.filter(
+            ResumenAuditoria.periodo >= desde, ResumenAuditoria.periodo < hasta
+        ).delete(synchronize_session=False)
+        if db.session.get_bind().dialect.name == "postgresql":
+            hora = func.date_trunc("hour", RegistroAuditoria.creado_en)
+        else:
+            hora = func.strftime("%Y-%m-%d %H:00:00", RegistroAuditoria.creado_en)
+        grupos = db.session.query(
+            hora, RegistroAuditoria.accion, RegistroAuditoria.estado,
+            func.coalesce(RegistroAuditoria.actor_usuario_id, 0), func.count(),
+        ).filter(
+            RegistroAuditoria.creado_en >= desde, RegistroAuditoria.creado_en < hasta
+        ).group_by(hora, RegistroAuditoria.accion, RegistroAuditoria.estado,
+                   func.coalesce(RegistroAuditoria.actor_usuario_id, 0)).all()
+        conteos = Counter({
+            (h if isinstance(h, datetime) else datetime.fromisoformat(h), a, e, u): n
+            for h, a, e, u, n in grupos
+        })
+        ResumenAuditoriaRepositorio.acumular(conteos)
+        db.session.commit()
+        return sum(conteos.values())
+
+    @staticmethod
+    def serie(granularidad: str, desde: datetime, hasta: datetime, accion: str | None = None,
+              estado: str | None = None, usuario_id: int | None = None, por: tuple[str, ...] = ()) -> list[dict]:
+        """Totales de los periodos que se solapan con [desde, hasta), desglosados además por las columnas de `por`"""
+        desde = truncar(desde, granularidad)
+        columnas = [getattr(ResumenAuditoria, c) for c in por]
+        query = db.session.query(ResumenAuditoria.periodo, *columnas, func.sum(ResumenAuditoria.total)).filter(
+            ResumenAuditoria.granularidad == granularidad,
+            ResumenAuditoria.periodo >= desde,
+            ResumenAuditoria.periodo < hasta,
+        )
+        if accion:
+            query = query.filter(ResumenAuditoria.accion == accion)
+        if estado:
+            query = query.filter(ResumenAuditoria.estado == estado)
+        if usuario_id is not None:
+            query = query.filter(ResumenAuditoria.actor_usuario_id == usuario_id)
+        filas = query.group_by(ResumenAuditoria.periodo, *columnas).order_by(ResumenAuditoria.periodo, *columnas).all()
+        return [
+            {"periodo": f[0].isoformat(), **dict(zip(por, f[1:-1])), "total": int(f[-1])}
+            for f in filas
+        ]
+
+@event.listens_for(Session, "after_flush")
+def _acumular_registros_nuevos(sesion: Session, contexto) -> None:
+    # Los registros que entran por el ORM (registrar, crear_lote...) se cuentan en su misma transacción
+    nuevos = [o for o in sesion.new if isinstance(o, RegistroAuditoria)]
+    if nuevos:
+        ResumenAuditoriaRepositorio.acumular(contar(
+            {"creado_en": r.creado_en, "accion": r.accion, "estado": r.estado, "actor_usuario_id": r.actor_usuario_id}
+            for r in nuevos
+        ), conexion=sesion.connection())
@@ -0,0 +1,57 @@
+from sqlalchemy.orm import undefer
+from ..extensions import db
+from ..models.blob_ref import BlobCompartido
+
+class BlobCompartidoRepositorio:
+    @staticmethod
+    def sumar_referencia(blob_id: int) -> bool:
+        """Incremento atómico; False si el blob ya quedó sin referencias (se está borrando)"""
+        filas = BlobCompartido.query.filter(
+            BlobCompartido.id == blob_id,
+            BlobCompartido.referencias > 0
+        ).update({"referencias": BlobCompartido.referencias + 1}, synchronize_session=False)
+        return filas == 1
+
+    @staticmethod
+    def restar_referencia(blob_id: int) -> int:
+        """Decremento atómico (sin commit); devuelve las referencias restantes"""
+        BlobCompartido.query.filter_by(id=blob_id).update(
+            {"referencias": BlobCompartido.referencias - 1}, synchronize_session=False
+        )
+        return db.session.query(BlobCompartido.referencias).filter_by(id=blob_id).scalar() or 0
+
+    @staticmethod
+    def eliminar(blob: BlobCompartido) -> None:
+        db.session.delete(blob)
+        db.session.commit()
+
+    @staticmethod
+    def existe_ruta(ruta: str) -> bool:
+        return db.session.query(BlobCompartido.id).filter_by(ruta_almacenamiento=ruta).first() is not None
+
+    @staticmethod
+    def listar_rutas_fs(desde: str, excluir_patron: str, limite: int) -> list[str]:
+        filas = db.session.query(BlobCompartido.ruta_almacenamiento).filter(
+            BlobCompartido.backend_almacenamiento == "fs",
+            BlobCompartido.ruta_almacenamiento > desde,
+            ~BlobCompartido.ruta_almacenamiento.like(excluir_patron)
+        ).distinct().order_by(BlobCompartido.ruta_almacenamiento).limit(limite).all()
+        return [fila[0] for fila in filas]
+
+    @staticmethod
+    def cambiar_ruta(ruta_anterior: str, ruta_nueva: str) -> int:
+        """Reapunta los blobs de `ruta_anterior` (sin commit)"""
+        return BlobCompartido.query.filter_by(ruta_almacenamiento=ruta_anterior).update(
+            {"ruta_almacenamiento": ruta_nueva}, synchronize_session=False
+        )
+
+    @staticmethod
+    def contar_en_db_blob() -> int:
+        return BlobCompartido.query.filter_by(backend_almacenamiento="db_blob").count()
+
+    @staticmethod
+    def listar_en_db_blob(desde_id: int, limite: int) -> list[BlobCompartido]:
+        return BlobCompartido.query.options(undefer(BlobCompartido.blob_cifrado)).filter(
+            BlobCompartido.backend_almacenamiento == "db_blob",
+            BlobCompartido.id > desde_id
+        ).order_by(BlobCompartido.id).limit(limite).with_for_update().all()
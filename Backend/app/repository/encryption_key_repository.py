@@ -9,10 +9,31 @@ class ClaveRepositorio:
         db.session.commit()
         return clave
 
+    @staticmethod
+    def buscar_por_id(clave_id: int) -> Optional[ClaveCifradoUsuario]:
+        return ClaveCifradoUsuario.query.get(clave_id)
+
     @staticmethod
     def obtener_activa_por_usuario(usuario_id: int) -> Optional[ClaveCifradoUsuario]:
         return ClaveCifradoUsuario.query.filter_by(usuario_id=usuario_id, activa=True).first()
 
+    @staticmethod
+    def listar_ids_por_usuario(usuario_id: int) -> list[int]:
+        filas = ClaveCifradoUsuario.query.with_entities(ClaveCifradoUsuario.id).filter_by(usuario_id=usuario_id).all()
+        return [fila.id for fila in filas]
+
+    @staticmethod
+    def contar_sin_kdf(kdf: str) -> int:
+        return ClaveCifradoUsuario.query.filter(ClaveCifradoUsuario.kdf != kdf).count()
+
+    @staticmethod
+    def listar_sin_kdf(kdf: str, desde_id: int, limite: int) -> list[ClaveCifradoUsuario]:
+        """Siguiente lote (por id) de claves envueltas con otro esquema de KEK, bloqueadas"""
+        return ClaveCifradoUsuario.query.filter(
+            ClaveCifradoUsuario.kdf != kdf,
+            ClaveCifradoUsuario.id > desde_id
+        ).order_by(ClaveCifradoUsuario.id).limit(limite).with_for_update().all()
+
     @staticmethod
     def desactivar_todas_por_usuario(usuario_id: int) -> None:
         """Desactivar todas las claves del usuario"""
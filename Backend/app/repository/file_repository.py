@@ -1,6 +1,8 @@
-from typing import Optional
+from typing import Callable, Optional
+from sqlalchemy.orm import load_only, undefer
 from ..extensions import db
 from ..models.file import Archivo
+from ..models.audit_log import RegistroAuditoria
 
 class ArchivoRepositorio:
     @staticmethod
@@ -9,10 +11,123 @@ class ArchivoRepositorio:
         db.session.commit()
         return archivo
 
+    @staticmethod
+    def crear_lote(archivos: list[Archivo], registro_auditoria: Callable[[Archivo], RegistroAuditoria]) -> list[Archivo]:
+        """Inserta los archivos y su auditoría en una única transacción"""
+        try:
+            db.session.add_all(archivos)
+            db.session.flush()  # Asigna ids para la auditoría
+            db.session.add_all([registro_auditoria(archivo) for archivo in archivos])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return archivos
+
     @staticmethod
     def buscar_por_id(archivo_id: int) -> Optional[Archivo]:
         return Archivo.query.get(archivo_id)
         
+    @staticmethod
+    def listar_metadatos(propietario_id: int) -> list[Archivo]:
+        """Archivos del propietario (más recientes primero) con sólo las columnas que se muestran"""
+        return Archivo.query.options(
+            load_only(Archivo.id, Archivo.nombre_original, Archivo.tipo_mime, Archivo.tamano_bytes,
+                      Archivo.creado_en, Archivo.hash_verificacion, Archivo.metadatos)
+        ).filter_by(propietario_id=propietario_id).order_by(Archivo.creado_en.desc()).all()
+
+    @staticmethod
+    def listar_para_exportar(propietario_id: int, ids: list[int] | None) -> list[Archivo]:
+        """
+        Archivos del propietario (todos o los de `ids`) con el blob ya cargado:
+        se van a descifrar todos, mejor una consulta que una por fila db_blob.
+        """
+        query = Archivo.query.options(undefer(Archivo.blob_cifrado)).filter_by(propietario_id=propietario_id)
+        if ids is not None:
+            query = query.filter(Archivo.id.in_(ids))
+        return query.order_by(Archivo.id).all()
+
+    @staticmethod
+    def buscar_duplicado(propietario_id: int, hash_verificacion: str, tamano_bytes: int) -> Optional[Archivo]:
+        """Archivo del mismo propietario con idéntico contenido (bloqueado para referenciarlo)"""
+        return Archivo.query.filter_by(
+            propietario_id=propietario_id,
+            hash_verificacion=hash_verificacion,
+            tamano_bytes=tamano_bytes
+        ).order_by(Archivo.id).with_for_update().first()
+
+    @staticmethod
+    def contar_por_ruta(ruta: str) -> int:
+        return Archivo.query.filter_by(ruta_almacenamiento=ruta).count()
+
+    @staticmethod
+    def asignar_clave_sin_asignar(propietario_id: int, clave_id: int) -> None:
+        """Marca con `clave_id` los archivos antiguos que no registran su UEK (sin commit)"""
+        Archivo.query.filter_by(propietario_id=propietario_id, clave_id=None).update(
+            {"clave_id": clave_id}, synchronize_session=False
+        )
+
+    @staticmethod
+    def contar_para_reenvolver(propietario_id: int, clave_id: int) -> int:
+        return Archivo.query.filter(
+            Archivo.propietario_id == propietario_id,
+            Archivo.clave_id != clave_id
+        ).count()
+
+    @staticmethod
+    def listar_para_reenvolver(propietario_id: int, clave_id: int, desde_id: int, limite: int) -> list[Archivo]:
+        """
+        Siguiente lote (por id) de archivos con la DEK envuelta bajo otra UEK, bloqueados.
+        Sólo se cargan las columnas de claves: el blob no hace falta para reenvolver.
+        """
+        return Archivo.query.options(
+            load_only(Archivo.id, Archivo.clave_id, Archivo.dek_envuelta)
+        ).filter(
+            Archivo.propietario_id == propietario_id,
+            Archivo.clave_id != clave_id,
+            Archivo.id > desde_id
+        ).order_by(Archivo.id).limit(limite).with_for_update().all()
+
+    @staticmethod
+    def listar_rutas_fs(desde: str, excluir_patron: str, limite: int) -> list[str]:
+        """Rutas fs distintas (orden alfabético, después de `desde`) que no encajan en `excluir_patron` (LIKE)"""
+        filas = db.session.query(Archivo.ruta_almacenamiento).filter(
+            Archivo.backend_almacenamiento == "fs",
+            Archivo.ruta_almacenamiento > desde,
+            ~Archivo.ruta_almacenamiento.like(excluir_patron)
+        ).distinct().order_by(Archivo.ruta_almacenamiento).limit(limite).all()
+        return [fila[0] for fila in filas]
+
+    @staticmethod
+    def cambiar_ruta(ruta_anterior: str, ruta_nueva: str) -> int:
+        """Reapunta todas las filas de `ruta_anterior` (sin commit)"""
+        return Archivo.query.filter_by(ruta_almacenamiento=ruta_anterior).update(
+            {"ruta_almacenamiento": ruta_nueva}, synchronize_session=False
+        )
+
+    @staticmethod
+    def contar_en_db_blob() -> int:
+        return Archivo.query.filter(
+            Archivo.backend_almacenamiento == "db_blob",
+            Archivo.blob_compartido_id.is_(None)
+        ).count()
+
+    @staticmethod
+    def listar_en_db_blob(desde_id: int, limite: int) -> list[Archivo]:
+        """Siguiente lote (por id) de archivos con el blob en la base de datos (ya cargado), bloqueados"""
+        return Archivo.query.options(undefer(Archivo.blob_cifrado)).filter(
+            Archivo.backend_almacenamiento == "db_blob",
+            Archivo.blob_compartido_id.is_(None),
+            Archivo.id > desde_id
+        ).order_by(Archivo.id).limit(limite).with_for_update().all()
+
+    @staticmethod
+    def reubicar_referencias(blob_compartido_id: int, backend: str, ruta: str | None) -> None:
+        """Copia la ubicación de un blob compartido a los archivos que lo usan (sin commit)"""
+        Archivo.query.filter_by(blob_compartido_id=blob_compartido_id).update(
+            {"backend_almacenamiento": backend, "ruta_almacenamiento": ruta}, synchronize_session=False
+        )
+
     @staticmethod
     def eliminar(archivo: Archivo) -> None:
         """Eliminar archivo de la base de datos"""
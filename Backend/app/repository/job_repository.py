@@ -0,0 +1,31 @@
+from typing import Optional
+from ..extensions import db
+from ..models.job import Trabajo
+
+class TrabajoRepositorio:
+    @staticmethod
+    def crear(trabajo: Trabajo) -> Trabajo:
+        db.session.add(trabajo)
+        db.session.commit()
+        return trabajo
+
+    @staticmethod
+    def buscar_por_id(trabajo_id: int) -> Optional[Trabajo]:
+        return Trabajo.query.get(trabajo_id)
+
+    @staticmethod
+    def buscar_activo(tipo: str, usuario_id: int | None = None) -> Optional[Trabajo]:
+        """Trabajo de `tipo` (del usuario, si se indica) que todavía no ha terminado"""
+        query = Trabajo.query.filter(
+            Trabajo.tipo == tipo,
+            Trabajo.estado.in_(("pendiente", "en_curso"))
+        )
+        if usuario_id is not None:
+            query = query.filter(Trabajo.usuario_id == usuario_id)
+        return query.order_by(Trabajo.id.desc()).first()
+
+    @staticmethod
+    def guardar(trabajo: Trabajo) -> Trabajo:
+        db.session.add(trabajo)
+        db.session.commit()
+        return trabajo
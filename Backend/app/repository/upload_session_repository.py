@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Optional
+from ..extensions import db
+from ..models.upload_session import SesionSubida
+
+class SesionSubidaRepositorio:
+    @staticmethod
+    def crear(sesion: SesionSubida) -> SesionSubida:
+        db.session.add(sesion)
+        db.session.commit()
+        return sesion
+
+    @staticmethod
+    def buscar_por_id(sesion_id: int) -> Optional[SesionSubida]:
+        return SesionSubida.query.get(sesion_id)
+
+    @staticmethod
+    def marcar(sesion_id: int, desde: str, hasta: str) -> bool:
+        """Cambio de estado atómico `desde` -> `hasta` (sin commit); False si otro se adelantó"""
+        filas = SesionSubida.query.filter_by(id=sesion_id, estado=desde).update(
+            {"estado": hasta}, synchronize_session=False
+        )
+        return filas == 1
+
+    @staticmethod
+    def listar_caducadas(ahora: datetime, limite: int) -> list[SesionSubida]:
+        """Sesiones abiertas cuyo plazo ya venció"""
+        return SesionSubida.query.filter(
+            SesionSubida.estado == "abierta",
+            SesionSubida.expira_en < ahora
+        ).order_by(SesionSubida.id).limit(limite).all()
+
+    @staticmethod
+    def guardar(sesion: SesionSubida) -> SesionSubida:
+        db.session.add(sesion)
+        db.session.commit()
+        return sesion
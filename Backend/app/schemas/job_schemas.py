@@ -0,0 +1,12 @@
+from marshmallow import Schema, fields
+
+class TrabajoSchema(Schema):
+    id = fields.Int(dump_only=True)
+    tipo = fields.Str()
+    estado = fields.Str()
+    procesados = fields.Int()
+    total = fields.Int(allow_none=True)
+    resultado = fields.Dict(allow_none=True)
+    error = fields.Str(allow_none=True)
+    creado_en = fields.DateTime()
+    terminado_en = fields.DateTime(allow_none=True)
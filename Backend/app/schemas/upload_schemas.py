@@ -0,0 +1,19 @@
+from marshmallow import Schema, fields, validate
+
+class SesionSubidaCrearSchema(Schema):
+    nombre = fields.Str(required=True, validate=validate.Length(min=1, max=255))
+    tipo_mime = fields.Str(required=False, allow_none=True)
+    tamano = fields.Int(required=True, validate=validate.Range(min=0))
+
+class SesionSubidaSchema(Schema):
+    id = fields.Int(dump_only=True)
+    nombre_original = fields.Str()
+    tipo_mime = fields.Str(allow_none=True)
+    tamano_total = fields.Int()
+    tamano_parte = fields.Int()
+    partes = fields.Int()
+    estado = fields.Str()
+    trabajo_id = fields.Int(allow_none=True)
+    archivo_id = fields.Int(allow_none=True)
+    creado_en = fields.DateTime()
+    expira_en = fields.DateTime()
@@ -0,0 +1,120 @@
+import json
+import os
+import zlib
+from datetime import date, datetime
+from typing import Iterable, Iterator
+from flask import current_app
+from ..extensions import db
+from ..repository.audit_repository import AuditoriaRepositorio, mes_siguiente, nombre_particion
+from ..utils.storage import escribir_atomico
+
+_ID_MAXIMO = 2 ** 63 - 1
+
+def _mes(momento: datetime | date) -> date:
+    return date(momento.year, momento.month, 1)
+
+def _restar_meses(mes: date, meses: int) -> date:
+    total = mes.year * 12 + mes.month - 1 - meses
+    return date(total // 12, total % 12 + 1, 1)
+
+def _jsonl_gzip(filas: Iterable[dict]) -> Iterator[bytes]:
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = formato gzip
+    for fila in filas:
+        linea = json.dumps(fila, default=lambda v: v.isoformat() if isinstance(v, (date, datetime)) else str(v))
+        datos = compresor.compress(linea.encode("utf-8") + b"\n")
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+def _archivar(base: str, mes: date, filas: Iterable[dict]) -> str:
+    """Vuelca `filas` a base/auditoria-AAAA-MM[.n].jsonl.gz sin pisar archivos anteriores"""
+    for n in range(1000):
+        sufijo = f".{n}" if n else ""
+        ruta = os.path.join(base, f"auditoria-{mes:%Y-%m}{sufijo}.jsonl.gz")
+        if os.path.exists(ruta):
+            continue
+        try:
+            escribir_atomico(ruta, _jsonl_gzip(filas), reemplazar=False)
+            return ruta
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"Demasiados archivos de auditoría para {mes:%Y-%m} en {base}")
+
+class RetencionAuditoriaServicio:
+    @staticmethod
+    def preparar_particiones(meses_adelante: int | None = None) -> list[str]:
+        """
+        Crea las particiones mensuales que falten desde el mes actual hasta
+        `meses_adelante` meses después. Sin particionado (SQLite) no hace nada.
+        Devuelve los nombres de las particiones creadas.
+        """
+        if not AuditoriaRepositorio.particionada():
+            return []
+        if meses_adelante is None:
+            meses_adelante = current_app.config.get("AUDIT_PARTITIONS_AHEAD", 3)
+        existentes = AuditoriaRepositorio.particiones_mensuales()
+        creadas = []
+        mes = _mes(datetime.utcnow())
+        for _ in range(meses_adelante + 1):
+            if mes not in existentes:
+                AuditoriaRepositorio.crear_particion(mes)
+                db.session.commit()
+                creadas.append(nombre_particion(mes))
+            mes = mes_siguiente(mes)
+        return creadas
+
+    @staticmethod
+    def aplicar_retencion(meses: int | None = None, ruta_archivo: str | None = None, tamano_lote: int = 1000) -> dict:
+        """
+        Quita de registros_auditoria los meses completos anteriores a los
+        últimos `meses` (AUDIT_RETENTION_MONTHS; 0 = conservar todo). Si hay
+        `ruta_archivo` (AUDIT_ARCHIVE_PATH), cada mes se vuelca antes a un
+        .jsonl.gz. Los resúmenes por hora y día no se tocan.
+        - PostgreSQL: cada partición vencida se desengancha, se archiva y se
+          borra con DROP TABLE, sin borrar fila a fila.
+        - SQLite (o filas que acabaron en la partición por defecto): se
+          archivan y se borran por meses en lotes de `tamano_lote`.
+        Se puede repetir sin riesgo: retoma particiones ya desenganchadas.
+        """
+        if meses is None:
+            meses = current_app.config.get("AUDIT_RETENTION_MONTHS", 0)
+        if ruta_archivo is None:
+            ruta_archivo = current_app.config.get("AUDIT_ARCHIVE_PATH") or None
+        resumen = {"particiones": [], "filas": 0, "archivos": []}
+        if meses <= 0:
+            return resumen
+        corte = _restar_meses(_mes(datetime.utcnow()), meses)
+
+        if AuditoriaRepositorio.particionada():
+            for mes, enganchada in sorted(AuditoriaRepositorio.particiones_mensuales().items()):
+                if mes >= corte:
+                    continue
+                if enganchada:
+                    AuditoriaRepositorio.separar_particion(mes)
+                    db.session.commit()
+                if ruta_archivo:
+                    resumen["archivos"].append(_archivar(ruta_archivo, mes, AuditoriaRepositorio.leer_particion(mes, tamano_lote)))
+                AuditoriaRepositorio.eliminar_particion(mes)
+                db.session.commit()
+                resumen["particiones"].append(nombre_particion(mes))
+
+        limite = datetime.combine(corte, datetime.min.time())
+        while (mes := AuditoriaRepositorio.primer_mes_antes_de(limite)) is not None:
+            desde = datetime.combine(mes, datetime.min.time())
+            hasta = min(datetime.combine(mes_siguiente(mes), datetime.min.time()), limite)
+            ultimo = {"id": 0}
+
+            def _filas() -> Iterator[dict]:
+                for fila in AuditoriaRepositorio.leer_entre(desde, hasta, tamano_lote):
+                    ultimo["id"] = max(ultimo["id"], fila["id"])
+                    yield fila
+
+            if ruta_archivo:
+                resumen["archivos"].append(_archivar(ruta_archivo, mes, _filas()))
+            else:
+                ultimo["id"] = _ID_MAXIMO
+            # Sólo se borra lo que se archivó (id <= último leído)
+            while borradas := AuditoriaRepositorio.eliminar_entre(desde, hasta, ultimo["id"], tamano_lote):
+                db.session.commit()
+                resumen["filas"] += borradas
+        return resumen
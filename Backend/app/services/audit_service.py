@@ -3,7 +3,8 @@ from ..models.audit_log import RegistroAuditoria
 
 class AuditoriaServicio:
     @staticmethod
-    def registrar(actor_usuario_id: int | None, accion: str, tipo_recurso: str | None, recurso_id: str | None, ip: str | None, agente: str | None, estado: str, detalles: dict | None):
+    def registrar(actor_usuario_id: int | None, accion: str, tipo_recurso: str | None, recurso_id: str | None, ip: str | None, agente: str | None, estado: str, detalles: dict | None, durable: bool = False):
+        """Con durable=True el registro queda escrito antes de volver; si no, va al próximo lote."""
         reg = RegistroAuditoria(
             actor_usuario_id=actor_usuario_id,
             accion=accion,
@@ -14,7 +15,10 @@ class AuditoriaServicio:
             estado=estado,
             detalles=detalles
         )
-        return AuditoriaRepositorio.registrar(reg)
+        if durable:
+            return AuditoriaRepositorio.registrar(reg)
+        AuditoriaRepositorio.encolar(reg)
+        return reg
     
     @staticmethod
     def registrar_simple(usuario_id: int, accion: str, detalles: str = None):
@@ -29,4 +33,5 @@ class AuditoriaServicio:
             estado="SUCCESS",
             detalles={"mensaje": detalles} if detalles else None
         )
-        return AuditoriaRepositorio.registrar(reg)
+        AuditoriaRepositorio.encolar(reg)
+        return reg
@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Callable
+from flask import Flask, current_app
+from ..extensions import db
+from ..models.job import Trabajo
+from ..repository.job_repository import TrabajoRepositorio
+
+# Pool de fondo compartido por todos los tipos de trabajo. Cada trabajo corre
+# con su propio app_context y persiste su progreso, así que si el proceso se
+# reinicia puede reanudarse desde `cursor`.
+
+_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+_workers = 2
+_manejadores: dict[str, Callable[[Trabajo], None]] = {}
+_en_ejecucion: set[int] = set()
+
+def configurar_trabajos(workers: int) -> None:
+    global _executor, _workers
+    with _lock:
+        if workers != _workers and _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        _workers = max(1, workers)
+
+def _obtener_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="trabajos")
+        return _executor
+
+def _ejecutar(app: Flask, trabajo_id: int) -> None:
+    with app.app_context():
+        try:
+            trabajo = TrabajoRepositorio.buscar_por_id(trabajo_id)
+            manejador = _manejadores[trabajo.tipo]
+            trabajo.estado = "en_curso"
+            TrabajoRepositorio.guardar(trabajo)
+            try:
+                manejador(trabajo)
+                trabajo.estado = "completado"
+                trabajo.terminado_en = datetime.utcnow()
+                TrabajoRepositorio.guardar(trabajo)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error en trabajo {trabajo_id}: {str(e)}")
+                trabajo = TrabajoRepositorio.buscar_por_id(trabajo_id)
+                trabajo.estado = "fallido"
+                trabajo.error = str(e) or e.__class__.__name__
+                TrabajoRepositorio.guardar(trabajo)
+        finally:
+            with _lock:
+                _en_ejecucion.discard(trabajo_id)
+            db.session.remove()
+
+class _LectorConProgreso:
+    """Cuenta en `trabajo.procesados` los bytes leídos y lo confirma como mucho una vez por intervalo"""
+    def __init__(self, trabajo: Trabajo, lector: BinaryIO, intervalo: float):
+        self._trabajo = trabajo
+        self._lector = lector
+        self._intervalo = intervalo
+        self._ultimo = time.monotonic()
+
+    def read(self, n: int = -1) -> bytes:
+        datos = self._lector.read(n)
+        self._trabajo.procesados += len(datos)
+        ahora = time.monotonic()
+        if ahora - self._ultimo >= self._intervalo:
+            self._ultimo = ahora
+            TrabajoRepositorio.guardar(self._trabajo)
+        return datos
+
+    def seekable(self) -> bool:
+        return self._lector.seekable()
+
+    def tell(self) -> int:
+        return self._lector.tell()
+
+    def seek(self, posicion: int, desde: int = 0) -> int:
+        posicion = self._lector.seek(posicion, desde)
+        self._trabajo.procesados = posicion
+        return posicion
+
+class TrabajoServicio:
+    @staticmethod
+    def registrar_manejador(tipo: str, manejador: Callable[[Trabajo], None]) -> None:
+        """
+        `manejador(trabajo)` hace el trabajo por lotes, confirmando en cada lote
+        su avance (procesados, cursor) junto con los datos. Al reanudar recibe
+        el mismo Trabajo y debe continuar desde `trabajo.cursor`.
+        """
+        _manejadores[tipo] = manejador
+
+    @staticmethod
+    def crear(tipo: str, usuario_id: int | None, parametros: dict | None = None, total: int | None = None) -> Trabajo:
+        if tipo not in _manejadores:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        return TrabajoRepositorio.crear(Trabajo(
+            tipo=tipo,
+            usuario_id=usuario_id,
+            estado="pendiente",
+            procesados=0,
+            total=total,
+            parametros=parametros or {},
+        ))
+
+    @staticmethod
+    def encolar(trabajo: Trabajo) -> None:
+        with _lock:
+            if trabajo.id in _en_ejecucion:
+                return
+            _en_ejecucion.add(trabajo.id)
+        _obtener_executor().submit(_ejecutar, current_app._get_current_object(), trabajo.id)
+
+    @staticmethod
+    def lector_con_progreso(trabajo: Trabajo, lector: BinaryIO, intervalo: float = 1.0) -> BinaryIO:
+        """Envuelve `lector` para que el avance (bytes leídos) sea visible en el estado del trabajo."""
+        return _LectorConProgreso(trabajo, lector, intervalo)
+
+    @staticmethod
+    def en_ejecucion(trabajo: Trabajo) -> bool:
+        return trabajo.id in _en_ejecucion
+
+    @staticmethod
+    def reanudar(trabajo: Trabajo) -> bool:
+        """Vuelve a encolar un trabajo fallido o interrumpido; False si no procede."""
+        if trabajo.estado == "completado" or TrabajoServicio.en_ejecucion(trabajo):
+            return False
+        trabajo.estado = "pendiente"
+        trabajo.error = None
+        TrabajoRepositorio.guardar(trabajo)
+        TrabajoServicio.encolar(trabajo)
+        return True
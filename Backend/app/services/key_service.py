@@ -1,23 +1,41 @@
 import os
+from flask import current_app
+from ..extensions import db
 from ..repository.encryption_key_repository import ClaveRepositorio
+from ..repository.file_repository import ArchivoRepositorio
+from ..repository.job_repository import TrabajoRepositorio
 from ..models.encryption_key import ClaveCifradoUsuario
-from ..cryptoutils.kdf import derivar_kek
+from ..models.file import Archivo
+from ..models.job import Trabajo
+from .job_service import TrabajoServicio
+from ..cryptoutils.kdf import derivar_kek, kek_raiz, derivar_kek_hija, VERSION_JERARQUIA
 from ..cryptoutils.keywrap import envolver, desarrollar
 from ..cryptoutils.aes import generar_bytes_aleatorios
+from ..cryptoutils.key_cache import cache_uek
+
+KDF_JERARQUIA = "argon2id+hkdf"  # Valor de `kdf` en las claves de la jerarquía versión 2
+
+def _master() -> bytes:
+    return os.getenv("MASTER_SECRET", "cambia-esto").encode()
 
 class ClaveServicio:
     @staticmethod
     def generar_uek_para_usuario(usuario_id: int, etiqueta: str = "clave principal") -> ClaveCifradoUsuario:
         try:
-            # Desactivar claves anteriores
+            # Los archivos antiguos sin clave registrada quedan ligados a la UEK que sale
+            anterior = ClaveRepositorio.obtener_activa_por_usuario(usuario_id)
+            if anterior:
+                ArchivoRepositorio.asignar_clave_sin_asignar(usuario_id, anterior.id)
+
+            # Desactivar claves anteriores y sacarlas de la cache
+            cache_uek.invalidar(ClaveRepositorio.listar_ids_por_usuario(usuario_id))
             ClaveRepositorio.desactivar_todas_por_usuario(usuario_id)
             
             # UEK aleatoria (32 bytes)
             uek = generar_bytes_aleatorios(32)
 
-            # KEK derivado de MASTER_SECRET (+ salt)
-            master = os.getenv("MASTER_SECRET", "cambia-esto").encode()
-            kek, kdf_salt, kdf_params = derivar_kek(master)
+            # KEK derivado de la KEK raíz (MASTER_SECRET estirado) + salt de la clave
+            kek, kdf_salt, kdf_params = ClaveServicio._kek_nueva()
 
             uek_envuelta = envolver(kek, uek)
 
@@ -25,12 +43,14 @@ class ClaveServicio:
                 usuario_id=usuario_id,
                 etiqueta=etiqueta,
                 uek_envuelta=uek_envuelta,
-                kdf="argon2id",
+                kdf=KDF_JERARQUIA,
                 kdf_salt=kdf_salt,
                 kdf_parametros=kdf_params,
                 activa=True,
             )
-            return ClaveRepositorio.crear(clave)
+            clave = ClaveRepositorio.crear(clave)
+            cache_uek.guardar(clave.id, uek)
+            return clave
         except Exception as e:
             print(f"Error generando UEK: {str(e)}")
             raise
@@ -41,6 +61,132 @@ class ClaveServicio:
         if not clave:
             clave = ClaveServicio.generar_uek_para_usuario(usuario_id)
 
-        master = os.getenv("MASTER_SECRET", "cambia-esto").encode()
-        kek, _, _ = derivar_kek(master, salt=clave.kdf_salt, params=clave.kdf_parametros)
-        return desarrollar(kek, clave.uek_envuelta)
+        return ClaveServicio.desenvolver_uek(clave)
+
+    @staticmethod
+    def uek_para_archivo(archivo: Archivo) -> bytes:
+        """UEK con la que está envuelta la DEK del archivo (puede ser una clave ya inactiva)."""
+        if archivo.clave_id is None:
+            return ClaveServicio.obtener_uek_desenvuelta_para_usuario(archivo.propietario_id)
+        return ClaveServicio.desenvolver_uek(ClaveRepositorio.buscar_por_id(archivo.clave_id))
+
+    @staticmethod
+    def rotar_uek(usuario_id: int, etiqueta: str = "clave principal") -> Trabajo:
+        """
+        Genera una UEK nueva y lanza en segundo plano el reenvoltorio de las DEK
+        de todos los archivos del usuario. Sólo cambia `dek_envuelta`: los blobs
+        cifrados no se leen ni se reescriben.
+        """
+        if TrabajoRepositorio.buscar_activo("rotacion_claves", usuario_id):
+            raise ValueError("Ya hay una rotación de claves en curso para este usuario")
+        nueva = ClaveServicio.generar_uek_para_usuario(usuario_id, etiqueta=etiqueta)
+        trabajo = TrabajoServicio.crear(
+            "rotacion_claves", usuario_id,
+            parametros={"clave_nueva_id": nueva.id},
+            total=ArchivoRepositorio.contar_para_reenvolver(usuario_id, nueva.id),
+        )
+        TrabajoServicio.encolar(trabajo)
+        return trabajo
+
+    @staticmethod
+    def _reenvolver_deks(trabajo: Trabajo) -> None:
+        """Manejador del trabajo "rotacion_claves": reenvuelve por lotes, un commit por lote."""
+        nueva = ClaveRepositorio.buscar_por_id(trabajo.parametros["clave_nueva_id"])
+        uek_nueva = ClaveServicio.desenvolver_uek(nueva)
+        ueks: dict[int, bytes] = {}
+        tamano_lote = current_app.config.get("KEY_ROTATION_BATCH_SIZE", 500)
+        while True:
+            archivos = ArchivoRepositorio.listar_para_reenvolver(
+                trabajo.usuario_id, nueva.id, trabajo.cursor or 0, tamano_lote
+            )
+            if not archivos:
+                break
+            for archivo in archivos:
+                if archivo.clave_id not in ueks:
+                    ueks[archivo.clave_id] = ClaveServicio.desenvolver_uek(ClaveRepositorio.buscar_por_id(archivo.clave_id))
+                dek = desarrollar(ueks[archivo.clave_id], archivo.dek_envuelta)
+                archivo.dek_envuelta = envolver(uek_nueva, dek)
+                archivo.clave_id = nueva.id
+            # Progreso y datos en la misma transacción: al reanudar no se repite nada
+            trabajo.cursor = archivos[-1].id
+            trabajo.procesados += len(archivos)
+            db.session.commit()
+        trabajo.resultado = {"clave_nueva_id": nueva.id, "reenvueltos": trabajo.procesados}
+
+    @staticmethod
+    def desenvolver_uek(clave: ClaveCifradoUsuario) -> bytes:
+        """UEK en claro de `clave`; el KDF sólo se ejecuta si no está en cache."""
+        uek = cache_uek.obtener(clave.id)
+        if uek is not None:
+            return uek
+
+        uek = desarrollar(ClaveServicio._kek_de(clave), clave.uek_envuelta)
+        cache_uek.guardar(clave.id, uek)
+        return uek
+
+    @staticmethod
+    def precalentar_kek_raiz() -> None:
+        """Estira MASTER_SECRET al arrancar, para que ninguna petición pague el Argon2 de la raíz."""
+        kek_raiz(_master(), bytes.fromhex(current_app.config["KEK_ROOT_SALT"]))
+
+    @staticmethod
+    def _kek_nueva() -> tuple[bytes, bytes, dict]:
+        """(kek, kdf_salt, kdf_parametros) para envolver una UEK con la jerarquía actual (versión 2)."""
+        salt_raiz = bytes.fromhex(current_app.config["KEK_ROOT_SALT"])
+        raiz, params_raiz = kek_raiz(_master(), salt_raiz)
+        kdf_salt = generar_bytes_aleatorios(16)
+        kdf_params = {"version": VERSION_JERARQUIA, "raiz_salt": salt_raiz.hex(), "raiz": params_raiz}
+        return derivar_kek_hija(raiz, kdf_salt), kdf_salt, kdf_params
+
+    @staticmethod
+    def _kek_de(clave: ClaveCifradoUsuario) -> bytes:
+        """
+        KEK con la que está envuelta la UEK de `clave`. En la versión 2 sólo cuesta un
+        HKDF (la raíz ya está estirada); las claves versión 1 repiten Argon2 en cada uso.
+        """
+        params = clave.kdf_parametros or {}
+        if params.get("version") == VERSION_JERARQUIA:
+            raiz, _ = kek_raiz(_master(), bytes.fromhex(params["raiz_salt"]), params["raiz"])
+            return derivar_kek_hija(raiz, clave.kdf_salt)
+        kek, _, _ = derivar_kek(_master(), salt=clave.kdf_salt, params=clave.kdf_parametros)
+        return kek
+
+    @staticmethod
+    def iniciar_migracion_jerarquia(admin_id: int) -> Trabajo:
+        """Lanza en segundo plano el reenvoltorio de las UEK versión 1 con la jerarquía actual."""
+        if TrabajoRepositorio.buscar_activo("migracion_jerarquia_claves"):
+            raise ValueError("Ya hay una migración de claves en curso")
+        trabajo = TrabajoServicio.crear(
+            "migracion_jerarquia_claves", admin_id,
+            total=ClaveRepositorio.contar_sin_kdf(KDF_JERARQUIA),
+        )
+        TrabajoServicio.encolar(trabajo)
+        return trabajo
+
+    @staticmethod
+    def _migrar_jerarquia(trabajo: Trabajo) -> None:
+        """
+        Manejador del trabajo "migracion_jerarquia_claves": por lotes, desenvuelve
+        cada UEK con su KEK antigua (un Argon2 por clave, la última vez) y la vuelve
+        a envolver con una KEK hija de la raíz. La UEK no cambia: ni DEK ni blobs se tocan.
+        """
+        tamano_lote = current_app.config.get("KEK_MIGRATION_BATCH_SIZE", 50)
+        while True:
+            claves = ClaveRepositorio.listar_sin_kdf(KDF_JERARQUIA, trabajo.cursor or 0, tamano_lote)
+            if not claves:
+                break
+            for clave in claves:
+                uek = ClaveServicio.desenvolver_uek(clave)
+                kek, kdf_salt, kdf_params = ClaveServicio._kek_nueva()
+                clave.uek_envuelta = envolver(kek, uek)
+                clave.kdf = KDF_JERARQUIA
+                clave.kdf_salt = kdf_salt
+                clave.kdf_parametros = kdf_params
+            # Progreso y claves en la misma transacción: al reanudar no se repite nada
+            trabajo.cursor = claves[-1].id
+            trabajo.procesados += len(claves)
+            db.session.commit()
+        trabajo.resultado = {"migradas": trabajo.procesados}
+
+TrabajoServicio.registrar_manejador("rotacion_claves", ClaveServicio._reenvolver_deks)
+TrabajoServicio.registrar_manejador("migracion_jerarquia_claves", ClaveServicio._migrar_jerarquia)
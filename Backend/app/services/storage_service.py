@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+from flask import current_app
+from ..extensions import db
+from ..repository.file_repository import ArchivoRepositorio
+from ..repository.blob_ref_repository import BlobCompartidoRepositorio
+from ..repository.job_repository import TrabajoRepositorio
+from ..models.job import Trabajo
+from .job_service import TrabajoServicio
+from ..utils.storage import ruta_fragmentada, es_ruta_fragmentada, escribir_atomico, obtener_backend
+
+def _copiar_a(ruta_origen: str, ruta_destino: str) -> None:
+    """Enlace duro si se puede (instantáneo, mismo sistema de archivos); si no, copia atómica."""
+    os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+    try:
+        os.link(ruta_origen, ruta_destino)
+    except OSError:
+        with open(ruta_origen, "rb") as f:
+            escribir_atomico(ruta_destino, iter(lambda: f.read(1024 * 1024), b""))
+
+class AlmacenamientoServicio:
+    @staticmethod
+    def fragmentar_rutas_fs(tamano_lote: int = 500, simular: bool = False) -> dict:
+        """
+        Pasa los blobs fs de la estructura plana (<nombre>.cifrado) a la
+        fragmentada (ab/cd/<id>.cifrado). Por cada lote: primero se crea la ruta
+        nueva (el blob sigue en la vieja), luego se reapuntan las filas de
+        archivos y blobs_compartidos en una transacción y sólo entonces se borra
+        la ruta vieja. Los lectores siempre encuentran el blob; si se interrumpe,
+        basta con volver a ejecutarlo.
+        """
+        base = current_app.config.get("FILE_STORAGE_PATH", "./data_archivos")
+        patron = os.path.join(base, "__", "__", "%")  # prefiltro SQL; la comprobación exacta es es_ruta_fragmentada
+        resumen = {"rutas": 0, "filas": 0, "faltantes": 0}
+
+        for repositorio in (ArchivoRepositorio, BlobCompartidoRepositorio):
+            ultima = ""
+            while True:
+                rutas = repositorio.listar_rutas_fs(ultima, patron, tamano_lote)
+                if not rutas:
+                    break
+                ultima = rutas[-1]
+                movidas = []
+                for ruta in rutas:
+                    if es_ruta_fragmentada(base, ruta):
+                        continue
+                    if not os.path.exists(ruta):
+                        resumen["faltantes"] += 1
+                        continue
+                    resumen["rutas"] += 1
+                    if simular:
+                        continue
+                    nueva = ruta_fragmentada(base, uuid.uuid4().hex)
+                    _copiar_a(ruta, nueva)
+                    resumen["filas"] += ArchivoRepositorio.cambiar_ruta(ruta, nueva)
+                    resumen["filas"] += BlobCompartidoRepositorio.cambiar_ruta(ruta, nueva)
+                    movidas.append(ruta)
+                db.session.commit()
+                for ruta in movidas:
+                    os.remove(ruta)
+        return resumen
+
+    @staticmethod
+    def iniciar_migracion_a_fs(admin_id: int) -> Trabajo:
+        """Lanza en segundo plano el paso de todos los blobs db_blob al backend fs."""
+        if TrabajoRepositorio.buscar_activo("migracion_db_a_fs"):
+            raise ValueError("Ya hay una migración de almacenamiento en curso")
+        trabajo = TrabajoServicio.crear(
+            "migracion_db_a_fs", admin_id,
+            parametros={"fase": "archivos"},
+            total=ArchivoRepositorio.contar_en_db_blob() + BlobCompartidoRepositorio.contar_en_db_blob(),
+        )
+        TrabajoServicio.encolar(trabajo)
+        return trabajo
+
+    @staticmethod
+    def _migrar_db_a_fs(trabajo: Trabajo) -> None:
+        """
+        Manejador del trabajo "migracion_db_a_fs". Por lotes pequeños: escribe
+        cada blob en fs (atómico), apunta la fila al archivo y vacía blob_cifrado
+        en una transacción junto con el avance. El archivo existe antes del
+        commit, así que los lectores nunca se quedan sin blob. Entre lotes se
+        duerme lo necesario para no pasar de STORAGE_MIGRATION_MAX_BYTES_PER_SECOND.
+        """
+        destino = obtener_backend("fs")
+        tamano_lote = current_app.config.get("STORAGE_MIGRATION_BATCH_SIZE", 50)
+        max_bytes_segundo = current_app.config.get("STORAGE_MIGRATION_MAX_BYTES_PER_SECOND", 0)
+        fases = {
+            "archivos": (ArchivoRepositorio.listar_en_db_blob, "blobs"),
+            "blobs": (BlobCompartidoRepositorio.listar_en_db_blob, None),
+        }
+        while trabajo.parametros["fase"]:
+            listar, siguiente_fase = fases[trabajo.parametros["fase"]]
+            filas = listar(trabajo.cursor or 0, tamano_lote)
+            if not filas:
+                # JSON mutable: se reasigna para que SQLAlchemy detecte el cambio
+                trabajo.parametros = {**trabajo.parametros, "fase": siguiente_fase}
+                trabajo.cursor = None
+                TrabajoRepositorio.guardar(trabajo)
+                continue
+
+            inicio = time.monotonic()
+            escritas, movidos = [], 0
+            try:
+                for fila in filas:
+                    if fila.blob_cifrado is None:
+                        continue  # Sin contenido que mover; se deja para revisión manual
+                    ruta, _ = destino.guardar([fila.blob_cifrado])
+                    escritas.append(ruta)
+                    movidos += len(fila.blob_cifrado)
+                    fila.backend_almacenamiento = "fs"
+                    fila.ruta_almacenamiento = ruta
+                    fila.blob_cifrado = None
+                    if trabajo.parametros["fase"] == "blobs":
+                        ArchivoRepositorio.reubicar_referencias(fila.id, "fs", ruta)
+                trabajo.cursor = filas[-1].id
+                trabajo.procesados += len(filas)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for ruta in escritas:
+                    destino.eliminar(ruta)
+                raise
+
+            if max_bytes_segundo > 0:
+                pendiente = movidos / max_bytes_segundo - (time.monotonic() - inicio)
+                if pendiente > 0:
+                    time.sleep(pendiente)
+        trabajo.resultado = {"migrados": trabajo.procesados}
+
+TrabajoServicio.registrar_manejador("migracion_db_a_fs", AlmacenamientoServicio._migrar_db_a_fs)
@@ -0,0 +1,272 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterator
+from flask import current_app
+from ..extensions import db
+from ..models.file import Archivo
+from ..models.job import Trabajo
+from ..models.upload_session import SesionSubida
+from ..repository.audit_repository import AuditoriaRepositorio
+from ..repository.encryption_key_repository import ClaveRepositorio
+from ..repository.job_repository import TrabajoRepositorio
+from ..repository.upload_session_repository import SesionSubidaRepositorio
+from ..cryptoutils.aes import generar_bytes_aleatorios
+from ..cryptoutils.aes_stream import generar_prefijo_nonce, numero_de_chunks, TAMANO_CHUNK_DEFECTO, TAMANO_TAG, MAX_CHUNKS
+from ..cryptoutils.aes_parallel import cifrar_tramo_paralelo, descifrar_flujo_paralelo
+from ..cryptoutils.keywrap import envolver, desarrollar
+from ..schemas.file_schemas import ArchivoRespuestaSchema
+from ..utils.storage import escribir_atomico, guardar_blob_flujo, eliminar_blob
+from .file_service import ArchivoServicio
+from .job_service import TrabajoServicio
+from .key_service import ClaveServicio
+
+_PATRON_PARTE = re.compile(r"^(\d+)\.parte$")
+
+def _directorio(sesion: SesionSubida) -> str:
+    return os.path.join(current_app.config["UPLOAD_SPOOL_PATH"], "sesiones", str(sesion.id))
+
+def _ruta_parte(directorio: str, numero: int) -> str:
+    return os.path.join(directorio, f"{numero:06d}.parte")
+
+def _dek(sesion: SesionSubida) -> bytes:
+    return desarrollar(ClaveServicio.desenvolver_uek(ClaveRepositorio.buscar_por_id(sesion.clave_id)), sesion.dek_envuelta)
+
+class _LectorLimitado:
+    """Lee como mucho `limite` bytes de `lector` y cuenta los que entrega"""
+    def __init__(self, lector: BinaryIO, limite: int):
+        self._lector = lector
+        self._restante = limite
+        self.leidos = 0
+
+    def read(self, n: int = -1) -> bytes:
+        if self._restante <= 0:
+            return b""
+        n = self._restante if n is None or n < 0 else min(n, self._restante)
+        datos = self._lector.read(n)
+        self._restante -= len(datos)
+        self.leidos += len(datos)
+        return datos
+
+class _LectorPartes:
+    """
+    Concatena los archivos de las partes en orden. Guarda lo leído en `pendiente`
+    para que quien descifra pueda reenviar exactamente esos bytes cifrados.
+    """
+    def __init__(self, rutas: list[str]):
+        self._rutas = iter(rutas)
+        self._actual: BinaryIO | None = None
+        self.pendiente = bytearray()
+
+    def read(self, n: int = -1) -> bytes:
+        while True:
+            if self._actual is None:
+                ruta = next(self._rutas, None)
+                if ruta is None:
+                    return b""
+                self._actual = open(ruta, "rb")
+            datos = self._actual.read(n)
+            if datos:
+                self.pendiente += datos
+                return datos
+            self._actual.close()
+            self._actual = None
+
+    def cerrar(self) -> None:
+        if self._actual is not None:
+            self._actual.close()
+            self._actual = None
+
+class SubidaServicio:
+    @staticmethod
+    def crear_sesion(propietario_id: int, nombre: str, tipo_mime: str | None, tamano: int) -> SesionSubida:
+        """
+        Abre una sesión para subir `tamano` bytes en partes de UPLOAD_PART_SIZE
+        (redondeado a chunks enteros, para que cada parte se cifre por su cuenta).
+        """
+        limite = current_app.config.get("UPLOAD_SESSION_MAX_BYTES", 0)
+        if limite and tamano > limite:
+            raise ValueError(f"El archivo supera el máximo de {limite} bytes")
+        tamano_chunk = current_app.config.get("FILE_CHUNK_SIZE", TAMANO_CHUNK_DEFECTO)
+        if numero_de_chunks(tamano, tamano_chunk) > MAX_CHUNKS:
+            raise ValueError("El archivo es demasiado grande para el tamaño de chunk configurado")
+        tamano_parte = current_app.config.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024)
+        if current_app.config.get("MAX_CONTENT_LENGTH"):
+            tamano_parte = min(tamano_parte, current_app.config["MAX_CONTENT_LENGTH"])
+        tamano_parte = max(1, tamano_parte // tamano_chunk) * tamano_chunk
+
+        clave_id, uek = ArchivoServicio._uek_activa(propietario_id)
+        horas = current_app.config.get("UPLOAD_SESSION_TTL_HOURS", 24)
+        return SesionSubidaRepositorio.crear(SesionSubida(
+            propietario_id=propietario_id,
+            nombre_original=nombre,
+            tipo_mime=tipo_mime,
+            tamano_total=tamano,
+            tamano_parte=tamano_parte,
+            tamano_chunk=tamano_chunk,
+            dek_envuelta=envolver(uek, generar_bytes_aleatorios(32)),
+            clave_id=clave_id,
+            nonce=generar_prefijo_nonce(),
+            estado="abierta",
+            expira_en=datetime.utcnow() + timedelta(hours=horas),
+        ))
+
+    @staticmethod
+    def partes_recibidas(sesion: SesionSubida) -> list[int]:
+        directorio = _directorio(sesion)
+        if not os.path.isdir(directorio):
+            return []
+        return sorted(int(m.group(1)) for m in map(_PATRON_PARTE.match, os.listdir(directorio)) if m)
+
+    @staticmethod
+    def partes_faltantes(sesion: SesionSubida) -> list[int]:
+        recibidas = set(SubidaServicio.partes_recibidas(sesion))
+        return [n for n in range(sesion.partes) if n not in recibidas]
+
+    @staticmethod
+    def recibir_parte(sesion: SesionSubida, numero: int, flujo: BinaryIO) -> None:
+        """
+        Cifra la parte `numero` mientras llega y la deja en el spool de la sesión.
+        La parte sólo aparece si llegó completa; FileExistsError si ya se había recibido.
+        """
+        if not 0 <= numero < sesion.partes:
+            raise ValueError(f"Número de parte fuera de rango (0-{sesion.partes - 1})")
+        esperado = sesion.tamano_de_parte(numero)
+        ruta = _ruta_parte(_directorio(sesion), numero)
+        if os.path.exists(ruta):
+            raise FileExistsError(f"La parte {numero} ya se recibió")
+        lector = _LectorLimitado(flujo, esperado + 1)
+        cifrado = cifrar_tramo_paralelo(
+            _dek(sesion), sesion.nonce, lector, sesion.tamano_chunk,
+            primer_indice=numero * (sesion.tamano_parte // sesion.tamano_chunk),
+            final=numero == sesion.partes - 1,
+        )
+
+        def _comprobado() -> Iterator[bytes]:
+            yield from cifrado
+            # Si falta o sobra algo, la excepción descarta el temporal antes de publicarlo
+            if lector.leidos != esperado:
+                raise ValueError(f"La parte {numero} debe tener {esperado} bytes")
+        escribir_atomico(ruta, _comprobado(), reemplazar=False)
+
+    @staticmethod
+    def completar(sesion: SesionSubida, ip: str | None, user_agent: str | None) -> Trabajo:
+        """Encola la consolidación de las partes en un Archivo (ver _completar_trabajo)."""
+        if not SesionSubidaRepositorio.marcar(sesion.id, "abierta", "completando"):
+            db.session.rollback()
+            raise ValueError("La sesión no está abierta")
+        trabajo = TrabajoServicio.crear(
+            "completar_subida", sesion.propietario_id,
+            parametros={"sesion_id": sesion.id, "ip": ip, "user_agent": user_agent},
+            total=sesion.partes,
+        )
+        sesion.trabajo_id = trabajo.id
+        SesionSubidaRepositorio.guardar(sesion)
+        TrabajoServicio.encolar(trabajo)
+        return trabajo
+
+    @staticmethod
+    def cancelar(sesion: SesionSubida) -> None:
+        if not SesionSubidaRepositorio.marcar(sesion.id, "abierta", "cancelada"):
+            db.session.rollback()
+            raise ValueError("La sesión no está abierta")
+        db.session.commit()
+        shutil.rmtree(_directorio(sesion), ignore_errors=True)
+
+    @staticmethod
+    def limpiar_caducadas(tamano_lote: int = 100) -> int:
+        """Cancela las sesiones abiertas vencidas y borra sus partes; devuelve cuántas"""
+        total = 0
+        while True:
+            sesiones = SesionSubidaRepositorio.listar_caducadas(datetime.utcnow(), tamano_lote)
+            if not sesiones:
+                return total
+            for sesion in sesiones:
+                sesion.estado = "cancelada"
+            db.session.commit()
+            for sesion in sesiones:
+                shutil.rmtree(_directorio(sesion), ignore_errors=True)
+            total += len(sesiones)
+
+    @staticmethod
+    def _completar_trabajo(trabajo: Trabajo) -> None:
+        """
+        Manejador del trabajo "completar_subida": concatena en orden las partes
+        cifradas hacia el backend configurado, verificando cada chunk y calculando
+        el SHA-256 del texto plano por el camino. Si falla, las partes siguen en
+        el spool y el trabajo se puede reanudar.
+        """
+        p = trabajo.parametros
+        sesion = SesionSubidaRepositorio.buscar_por_id(p["sesion_id"])
+        if sesion.estado == "completada":
+            return
+        directorio = _directorio(sesion)
+        dek = _dek(sesion)
+        lector = _LectorPartes([_ruta_parte(directorio, n) for n in range(sesion.partes)])
+        h = hashlib.sha256()
+        estado = {"tamano": 0, "tag": b"", "guardado": time.monotonic()}
+        trabajo.procesados = 0
+
+        def _verificados() -> Iterator[bytes]:
+            try:
+                for plano in descifrar_flujo_paralelo(dek, sesion.nonce, lector, sesion.tamano_chunk):
+                    h.update(plano)
+                    estado["tamano"] += len(plano)
+                    n = len(plano) + TAMANO_TAG
+                    cifrado = bytes(lector.pendiente[:n])
+                    del lector.pendiente[:n]
+                    estado["tag"] = cifrado[-TAMANO_TAG:]
+                    trabajo.procesados = estado["tamano"] // sesion.tamano_parte
+                    if time.monotonic() - estado["guardado"] >= 1.0:
+                        estado["guardado"] = time.monotonic()
+                        TrabajoRepositorio.guardar(trabajo)
+                    yield cifrado
+            finally:
+                lector.cerrar()
+
+        backend, ruta, blob = guardar_blob_flujo(sesion.nombre_original, _verificados(), sesion.tipo_mime)
+        try:
+            if estado["tamano"] != sesion.tamano_total:
+                raise ValueError("El tamaño consolidado no coincide con el declarado")
+            # Si entretanto se rotó la UEK, la DEK se envuelve ya con la activa
+            clave_id, dek_envuelta = sesion.clave_id, sesion.dek_envuelta
+            clave_activa_id, uek_activa = ArchivoServicio._uek_activa(sesion.propietario_id)
+            if clave_activa_id != clave_id:
+                clave_id, dek_envuelta = clave_activa_id, envolver(uek_activa, dek)
+            archivo = Archivo(
+                propietario_id=sesion.propietario_id,
+                nombre_original=sesion.nombre_original,
+                tipo_mime=sesion.tipo_mime,
+                tamano_bytes=sesion.tamano_total,
+                backend_almacenamiento=backend,
+                ruta_almacenamiento=ruta,
+                blob_cifrado=blob,
+                dek_envuelta=dek_envuelta,
+                clave_id=clave_id,
+                nonce=sesion.nonce,
+                tag=estado["tag"],
+                hash_verificacion=h.hexdigest(),
+                metadatos={
+                    "version": 2,
+                    "tamano_chunk": sesion.tamano_chunk,
+                    "chunks": numero_de_chunks(sesion.tamano_total, sesion.tamano_chunk),
+                },
+            )
+            db.session.add(archivo)
+            db.session.flush()
+            sesion.estado = "completada"
+            sesion.archivo_id = archivo.id
+            # Archivo, sesión y auditoría en la misma transacción: reanudar nunca duplica el archivo
+            AuditoriaRepositorio.registrar(ArchivoServicio._registro_cifrado(archivo, p["ip"], p["user_agent"]))
+        except Exception:
+            db.session.rollback()
+            eliminar_blob(backend, ruta)
+            raise
+        trabajo.procesados = sesion.partes
+        trabajo.resultado = {"archivo": ArchivoRespuestaSchema().dump(archivo)}
+        shutil.rmtree(directorio, ignore_errors=True)
+
+TrabajoServicio.registrar_manejador("completar_subida", SubidaServicio._completar_trabajo)
@@ -0,0 +1,199 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from flask import Flask
+from ..extensions import db
+from ..models.audit_log import RegistroAuditoria
+
+logger = logging.getLogger(__name__)
+
+POLITICAS_DESBORDE = ("sincrono", "bloquear", "descartar")
+
+def _fila(registro: RegistroAuditoria) -> dict:
+    """Valores de columna del registro, ya sin objeto ORM que compartir entre hilos."""
+    fila = {c.key: getattr(registro, c.key) for c in RegistroAuditoria.__table__.columns if c.key != "id"}
+    fila["estado"] = fila["estado"] or "SUCCESS"
+    # La hora es la del evento, no la del volcado
+    fila["creado_en"] = fila["creado_en"] or datetime.utcnow()
+    return fila
+
+class SumideroAuditoria:
+    """
+    Escritor de auditoría en segundo plano: los registros se encolan en memoria
+    y un hilo los inserta por lotes (un INSERT multi-fila por lote) cuando hay
+    `tamano_lote` pendientes o han pasado `intervalo` segundos.
+    - La cola tiene `capacidad` fija; si se llena se aplica `politica`:
+      "sincrono" escribe el registro en el hilo que llama (no se pierde nada),
+      "bloquear" espera hueco hasta `espera` segundos y después escribe en línea,
+      "descartar" lo cuenta y lo tira.
+    - Al salir el proceso se vacía la cola (atexit); cerrar() hace lo mismo a mano.
+    - Lo que deba quedar escrito antes de responder no pasa por aquí:
+      AuditoriaRepositorio.registrar sigue siendo síncrono y transaccional.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._app: Optional[Flask] = None
+        self._cola: "queue.Queue[dict]" = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+        self._despertar = threading.Event()
+        self._vaciado = threading.Condition(self._lock)
+        self.activo = False
+        self.capacidad = 10000
+        self.tamano_lote = 200
+        self.intervalo = 1.0
+        self.politica = "sincrono"
+        self.espera = 1.0
+        self.escritos = 0
+        self.lotes = 0
+        self.sincronos = 0
+        self.descartados = 0
+        self.errores = 0
+        atexit.register(self.cerrar)
+
+    def configurar(self, app: Flask, activo: bool, capacidad: int, tamano_lote: int,
+                   intervalo: float, politica: str, espera: float) -> None:
+        if politica not in POLITICAS_DESBORDE:
+            raise ValueError(f"AUDIT_OVERFLOW_POLICY debe ser una de {POLITICAS_DESBORDE}")
+        # Lo que quedara encolado para la app anterior se escribe con ella
+        self.cerrar()
+        with self._lock:
+            self._app = app
+            self.activo = activo
+            self.capacidad = max(1, capacidad)
+            self.tamano_lote = max(1, tamano_lote)
+            self.intervalo = max(0.01, intervalo)
+            self.politica = politica
+            self.espera = max(0.0, espera)
+            self._cola = queue.Queue(maxsize=self.capacidad)
+
+    def encolar(self, registro: RegistroAuditoria) -> None:
+        """Deja el registro para el próximo lote (o lo escribe ya, según configuración y política)."""
+        if not self.activo or self._app is None:
+            self._escribir_sincrono(registro)
+            return
+        fila = _fila(registro)
+        self._arrancar()
+        try:
+            self._cola.put_nowait(fila)
+        except queue.Full:
+            if self.politica == "descartar":
+                with self._lock:
+                    self.descartados += 1
+                logger.warning("Cola de auditoría llena: registro %s descartado", fila["accion"])
+                return
+            if self.politica == "bloquear":
+                try:
+                    self._cola.put(fila, timeout=self.espera)
+                    return
+                except queue.Full:
+                    pass
+            self._escribir_sincrono(registro)
+            return
+        if self._cola.qsize() >= self.tamano_lote:
+            self._despertar.set()
+
+    def vaciar(self, timeout: float | None = None) -> bool:
+        """Espera a que todo lo encolado hasta ahora esté en la base de datos; False si vence el plazo."""
+        if self._hilo is None:
+            return self._cola.empty()
+        limite = None if timeout is None else time.monotonic() + timeout
+        self._despertar.set()
+        with self._vaciado:
+            while self._cola.unfinished_tasks:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._vaciado.wait(restante if restante is not None else 0.5)
+                self._despertar.set()
+        return True
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Vacía la cola y detiene el hilo escritor."""
+        hilo = self._hilo
+        if hilo is None:
+            return
+        self.vaciar(timeout)
+        with self._lock:
+            self._hilo = None
+        self._despertar.set()
+        hilo.join(timeout)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "asincrono": self.activo,
+                "pendientes": self._cola.qsize(),
+                "capacidad": self.capacidad,
+                "politica": self.politica,
+                "escritos": self.escritos,
+                "lotes": self.lotes,
+                "sincronos": self.sincronos,
+                "descartados": self.descartados,
+                "errores": self.errores,
+            }
+
+    def _escribir_sincrono(self, registro: RegistroAuditoria) -> None:
+        with self._lock:
+            self.sincronos += 1
+        db.session.add(registro)
+        db.session.commit()
+
+    def _arrancar(self) -> None:
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="auditoria", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self) -> None:
+        hilo = threading.current_thread()
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            while True:
+                lote = self._tomar_lote()
+                if not lote:
+                    break
+                self._insertar(lote)
+            if self._hilo is not hilo:
+                return
+
+    def _tomar_lote(self) -> list[dict]:
+        lote = []
+        while len(lote) < self.tamano_lote:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _insertar(self, lote: list[dict]) -> None:
+        try:
+            # Import diferido: el repositorio importa este módulo
+            from ..repository.audit_repository import AuditoriaRepositorio
+            with self._app.app_context():
+                try:
+                    AuditoriaRepositorio.insertar_lote(lote)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            with self._lock:
+                self.escritos += len(lote)
+                self.lotes += 1
+        except Exception:
+            with self._lock:
+                self.errores += len(lote)
+            logger.exception("No se pudo escribir un lote de %d registros de auditoría", len(lote))
+        finally:
+            with self._vaciado:
+                for _ in lote:
+                    self._cola.task_done()
+                self._vaciado.notify_all()
+
+# Instancia compartida por el proceso (se configura en crear_app)
+sumidero_auditoria = SumideroAuditoria()
@@ -0,0 +1,103 @@
+import io
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Iterable, Optional
+
+class CacheBlobs:
+    """
+    Cache en proceso de blobs cifrados, indexada por Archivo.id.
+    - Límite por tamaño total (bytes) con desalojo LRU.
+    - Sólo entran blobs de hasta max_bytes_entrada: uno grande no vacía la cache.
+    - Guarda texto cifrado tal cual está en el backend, nunca texto plano.
+    - max_bytes <= 0 desactiva la cache.
+    """
+    def __init__(self, max_bytes: int = 0, max_bytes_entrada: int = 0):
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[int, bytes]" = OrderedDict()
+        self._ocupados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.configurar(max_bytes, max_bytes_entrada)
+
+    def configurar(self, max_bytes: int, max_bytes_entrada: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.max_bytes_entrada = min(max_bytes_entrada, max_bytes)
+            self._recortar()
+
+    @property
+    def activa(self) -> bool:
+        return self.max_bytes > 0 and self.max_bytes_entrada > 0
+
+    def admite(self, tamano: int | None) -> bool:
+        return self.activa and tamano is not None and tamano <= self.max_bytes_entrada
+
+    def obtener(self, archivo_id: int) -> Optional[bytes]:
+        with self._lock:
+            datos = self._entradas.get(archivo_id)
+            if datos is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(archivo_id)
+            self.aciertos += 1
+            return datos
+
+    def guardar(self, archivo_id: int, datos: bytes) -> None:
+        if not self.admite(len(datos)):
+            return
+        with self._lock:
+            anterior = self._entradas.pop(archivo_id, None)
+            if anterior is not None:
+                self._ocupados -= len(anterior)
+            self._entradas[archivo_id] = datos
+            self._ocupados += len(datos)
+            self._recortar()
+
+    def invalidar(self, archivo_ids: Iterable[int]) -> None:
+        with self._lock:
+            for archivo_id in archivo_ids:
+                anterior = self._entradas.pop(archivo_id, None)
+                if anterior is not None:
+                    self._ocupados -= len(anterior)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._ocupados = 0
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._ocupados,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+    def abrir(self, archivo_id: int, tamano_estimado: int | None,
+              abrir: Callable[[], BinaryIO], admitir: bool = True) -> BinaryIO:
+        """
+        Flujo del blob de `archivo_id`: desde memoria si está en cache; si no,
+        con `abrir()`. Con `admitir` y un blob lo bastante pequeño se lee entero
+        y se guarda para las siguientes descargas.
+        """
+        datos = self.obtener(archivo_id) if self.activa else None
+        if datos is not None:
+            return io.BytesIO(datos)
+        flujo = abrir()
+        if not admitir or not self.admite(tamano_estimado):
+            return flujo
+        with flujo:
+            datos = flujo.read()
+        self.guardar(archivo_id, datos)
+        return io.BytesIO(datos)
+
+    def _recortar(self) -> None:
+        # Llamar con el lock tomado
+        limite = max(self.max_bytes, 0) if self.activa else 0
+        while self._ocupados > limite and self._entradas:
+            self._ocupados -= len(self._entradas.popitem(last=False)[1])
+
+# Instancia compartida por el proceso (se configura en crear_app)
+cache_blobs = CacheBlobs()
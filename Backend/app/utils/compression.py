@@ -0,0 +1,102 @@
+import math
+import zlib
+from collections import Counter
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+CODEC_ZLIB = "zlib"
+NIVEL_ZLIB = 1  # Nivel rápido: casi toda la ganancia en texto a una fracción del coste
+UMBRAL_ENTROPIA = 7.2  # bits/byte; por encima, la muestra ya está comprimida o cifrada
+
+_MIME_COMPRIMIBLES = (
+    "text/", "application/json", "application/xml", "application/javascript",
+    "application/x-ndjson", "application/x-yaml", "application/yaml", "application/sql",
+    "application/csv", "application/x-sh", "image/svg+xml",
+)
+_MIME_YA_COMPRIMIDOS = (
+    "image/", "video/", "audio/", "application/zip", "application/gzip", "application/x-gzip",
+    "application/x-7z-compressed", "application/x-rar-compressed", "application/x-bzip2",
+    "application/x-xz", "application/zstd", "application/pdf",
+    "application/vnd.openxmlformats-officedocument",
+)
+
+def entropia(muestra: bytes) -> float:
+    """Entropía de Shannon de la muestra en bits por byte (0 a 8)."""
+    if not muestra:
+        return 0.0
+    total = len(muestra)
+    return -sum(n / total * math.log2(n / total) for n in Counter(muestra).values())
+
+def elegir_codec(tipo_mime: Optional[str], muestra: bytes) -> Optional[str]:
+    """
+    Decide si comprimir antes de cifrar: por tipo MIME cuando es concluyente
+    y, si no, por la entropía del primer bloque.
+    """
+    mime = (tipo_mime or "").lower()
+    if mime.startswith(_MIME_COMPRIMIBLES):
+        return CODEC_ZLIB
+    if mime.startswith(_MIME_YA_COMPRIMIDOS):
+        return None
+    return CODEC_ZLIB if entropia(muestra) < UMBRAL_ENTROPIA else None
+
+class LectorComprimido:
+    """
+    Envuelve un flujo y ofrece read() sobre su versión comprimida, sin
+    cargarlo entero. `al_leer` recibe cada bloque en claro antes de comprimirlo.
+    """
+    def __init__(self, lector: BinaryIO, tamano_bloque: int,
+                 al_leer: Optional[Callable[[bytes], None]] = None):
+        self._lector = lector
+        self._tamano_bloque = tamano_bloque
+        self._al_leer = al_leer
+        self._compresor = zlib.compressobj(NIVEL_ZLIB)
+        self._pendiente = bytearray()
+        self._fin = False
+
+    def read(self, n: int = -1) -> bytes:
+        while not self._fin and (n < 0 or len(self._pendiente) < n):
+            bloque = self._lector.read(self._tamano_bloque)
+            if not bloque:
+                self._pendiente += self._compresor.flush()
+                self._fin = True
+                break
+            if self._al_leer is not None:
+                self._al_leer(bloque)
+            self._pendiente += self._compresor.compress(bloque)
+        if n < 0:
+            n = len(self._pendiente)
+        datos = bytes(self._pendiente[:n])
+        del self._pendiente[:n]
+        return datos
+
+class LectorConPrefijo:
+    """Devuelve primero `prefijo` (bytes ya consumidos del flujo) y luego el resto del flujo."""
+    def __init__(self, prefijo: bytes, lector: BinaryIO):
+        self._prefijo = prefijo
+        self._lector = lector
+
+    def read(self, n: int = -1) -> bytes:
+        if self._prefijo:
+            if n < 0:
+                datos, self._prefijo = self._prefijo + self._lector.read(), b""
+                return datos
+            datos, self._prefijo = self._prefijo[:n], self._prefijo[n:]
+            return datos
+        return self._lector.read(n)
+
+def descomprimir_flujo(codec: Optional[str], chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Descompresión en streaming de los chunks ya descifrados (identidad si no hay codec)."""
+    if not codec:
+        yield from chunks
+        return
+    if codec != CODEC_ZLIB:
+        raise ValueError(f"Codec de compresión no soportado: {codec}")
+    descompresor = zlib.decompressobj()
+    for chunk in chunks:
+        datos = descompresor.decompress(chunk)
+        if datos:
+            yield datos
+    resto = descompresor.flush()
+    if resto:
+        yield resto
+    if not descompresor.eof:
+        raise ValueError("Flujo comprimido truncado")
@@ -0,0 +1,16 @@
+import base64
+from datetime import datetime
+
+def codificar_cursor(momento: datetime, identificador: int) -> str:
+    """Cursor opaco de paginación por clave (momento, id): base64 url-safe sin relleno."""
+    crudo = f"{momento.isoformat()}|{identificador}".encode("ascii")
+    return base64.urlsafe_b64encode(crudo).rstrip(b"=").decode("ascii")
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverso de codificar_cursor; ValueError si el cursor no es válido."""
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        momento, identificador = crudo.split("|")
+        return datetime.fromisoformat(momento), int(identificador)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Cursor de paginación inválido") from e
@@ -0,0 +1,71 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_FIN = object()
+_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+_workers = 4
+
+def configurar_readahead(workers: int) -> None:
+    global _executor, _workers
+    with _lock:
+        if workers != _workers and _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        _workers = max(1, workers)
+
+def _obtener_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="readahead")
+        return _executor
+
+def leer_por_adelantado(elementos: Iterable[T], profundidad: int) -> Iterator[T]:
+    """
+    Consume `elementos` en un hilo del pool y mantiene hasta `profundidad`
+    resultados listos, para solapar el trabajo del productor (E/S + descifrado)
+    con el del consumidor (envío por el socket).
+    Si el consumidor se cierra antes de tiempo, el productor se detiene.
+    Las excepciones del productor se relanzan en el consumidor.
+    """
+    if profundidad <= 0:
+        yield from elementos
+        return
+
+    cola: "queue.Queue" = queue.Queue(maxsize=profundidad)
+    parar = threading.Event()
+
+    def _poner(valor) -> bool:
+        while not parar.is_set():
+            try:
+                cola.put(valor, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _producir():
+        try:
+            for elemento in elementos:
+                if not _poner((elemento, None)):
+                    return
+            _poner((_FIN, None))
+        except BaseException as e:
+            _poner((_FIN, e))
+
+    _obtener_executor().submit(_producir)
+    try:
+        while True:
+            elemento, error = cola.get()
+            if elemento is _FIN:
+                if error is not None:
+                    raise error
+                return
+            yield elemento
+    finally:
+        parar.set()
@@ -1,26 +1,176 @@
+import io
 import os
-from typing import Tuple
+import re
+import uuid
+from urllib.parse import quote
+from typing import BinaryIO, Callable, Iterable, Tuple
 from flask import current_app
 
+_PATRON_FRAGMENTADA = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.cifrado$")
+
 def guardar_blob(nombre: str, datos_cifrados: bytes, tipo_mime: str | None) -> Tuple[str, str | None, bytes | None]:
-    backend = current_app.config.get("FILE_STORAGE_BACKEND", "db_blob")
-    if backend == "fs":
+    return guardar_blob_flujo(nombre, [datos_cifrados], tipo_mime)
+
+def ruta_fragmentada(base: str, identificador: str) -> str:
+    """
+    Ruta del blob `identificador` (hex) con dos niveles de reparto:
+    base/ab/cd/abcd....cifrado. Con ids aleatorios cada directorio hoja
+    recibe ~1/65536 de los blobs, así que ninguno crece sin límite.
+    """
+    return os.path.join(base, identificador[0:2], identificador[2:4], identificador + ".cifrado")
+
+def es_ruta_fragmentada(base: str, ruta: str) -> bool:
+    relativa = os.path.relpath(os.path.abspath(ruta), os.path.abspath(base)).replace(os.sep, "/")
+    return _PATRON_FRAGMENTADA.match(relativa) is not None
+
+def escribir_atomico(ruta: str, chunks: Iterable[bytes], reemplazar: bool = True) -> None:
+    """
+    Escribe en un temporal del mismo directorio y lo renombra al final:
+    nunca queda a la vista un blob a medio escribir.
+    Con reemplazar=False el paso final es un enlace que falla con FileExistsError
+    si `ruta` ya existe, así que de dos escrituras simultáneas sólo gana una.
+    """
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temporal, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        if reemplazar:
+            os.replace(temporal, ruta)
+        else:
+            os.link(temporal, ruta)
+            os.remove(temporal)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+class BackendAlmacenamiento:
+    """
+    Interfaz de un backend de blobs cifrados. Una fila guarda (backend, ruta, blob):
+    `ruta` es lo que devuelve guardar() para localizar el objeto y `blob` sólo lo
+    usan los backends que guardan los bytes en la propia fila.
+    """
+    nombre: str
+
+    def guardar(self, chunks: Iterable[bytes]) -> Tuple[str | None, bytes | None]:
+        """Consume los chunks (en streaming si el backend lo permite) y devuelve (ruta, blob)."""
+        raise NotImplementedError
+
+    def abrir(self, ruta: str | None, blob: bytes | None) -> BinaryIO:
+        """Flujo de lectura con seek (descifrar_rango salta directamente al chunk)."""
+        raise NotImplementedError
+
+    def leer_rango(self, ruta: str | None, blob: bytes | None, inicio: int, fin: int) -> bytes:
+        """Bytes [inicio, fin) del blob."""
+        with self.abrir(ruta, blob) as flujo:
+            flujo.seek(inicio)
+            return flujo.read(fin - inicio)
+
+    def eliminar(self, ruta: str | None) -> None:
+        pass
+
+class BackendFs(BackendAlmacenamiento):
+    """Un archivo por blob bajo FILE_STORAGE_PATH, en ruta fragmentada y escrito de forma atómica."""
+    nombre = "fs"
+
+    def guardar(self, chunks):
         base = current_app.config.get("FILE_STORAGE_PATH", "./data_archivos")
-        os.makedirs(base, exist_ok=True)
-        ruta = os.path.join(base, nombre + ".cifrado")
-        with open(ruta, "wb") as f:
-            f.write(datos_cifrados)
-        return "fs", ruta, None
-    else:
-        return "db_blob", None, datos_cifrados
+        ruta = ruta_fragmentada(base, uuid.uuid4().hex)
+        escribir_atomico(ruta, chunks)
+        return ruta, None
 
-def leer_blob(backend: str, ruta: str | None, blob: bytes | None) -> bytes:
-    if backend == "fs":
+    def abrir(self, ruta, blob):
         if not ruta or not os.path.exists(ruta):
             raise FileNotFoundError("Ruta de archivo cifrado no encontrada")
-        with open(ruta, "rb") as f:
-            return f.read()
-    else:
+        return open(ruta, "rb")
+
+    def eliminar(self, ruta):
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+class BackendDbBlob(BackendAlmacenamiento):
+    """Los bytes viajan en la propia fila (columna blob_cifrado)."""
+    nombre = "db_blob"
+
+    def guardar(self, chunks):
+        return None, b"".join(chunks)
+
+    def abrir(self, ruta, blob):
         if blob is None:
             raise ValueError("Blob cifrado vacío")
-        return blob
+        return io.BytesIO(blob)
+
+_fabricas: dict[str, Callable[[], BackendAlmacenamiento]] = {}
+
+def registrar_backend(nombre: str, fabrica: Callable[[], BackendAlmacenamiento]) -> None:
+    """`fabrica()` se llama una vez por app (dentro de su contexto) la primera vez que se usa `nombre`."""
+    _fabricas[nombre] = fabrica
+
+def obtener_backend(nombre: str | None = None) -> BackendAlmacenamiento:
+    """Backend `nombre`, o el de FILE_STORAGE_BACKEND si no se indica."""
+    nombre = nombre or current_app.config.get("FILE_STORAGE_BACKEND", "db_blob")
+    instancias = current_app.extensions.setdefault("almacenamiento", {})
+    if nombre not in instancias:
+        if nombre not in _fabricas:
+            raise ValueError(f"Backend de almacenamiento desconocido: {nombre}")
+        instancias[nombre] = _fabricas[nombre]()
+    return instancias[nombre]
+
+def _crear_backend_s3() -> BackendAlmacenamiento:
+    from .storage_s3 import BackendS3
+    return BackendS3.desde_config(current_app.config)
+
+registrar_backend("fs", BackendFs)
+registrar_backend("db_blob", BackendDbBlob)
+registrar_backend("s3", _crear_backend_s3)
+
+def guardar_blob_flujo(nombre: str, chunks_cifrados: Iterable[bytes], tipo_mime: str | None) -> Tuple[str, str | None, bytes | None]:
+    """
+    Igual que guardar_blob pero consume un iterable de chunks con el backend de
+    FILE_STORAGE_BACKEND (fs y s3 los escriben en cuanto llegan). La ruta es
+    nueva por blob: el nombre original no interviene, así que no hay colisiones.
+    """
+    backend = obtener_backend()
+    ruta, blob = backend.guardar(chunks_cifrados)
+    return backend.nombre, ruta, blob
+
+def ruta_temporal_subida() -> str:
+    """Ruta nueva en UPLOAD_SPOOL_PATH para volcar una subida que se cifrará más tarde."""
+    base = current_app.config["UPLOAD_SPOOL_PATH"]
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, f"{uuid.uuid4().hex}.subida")
+
+def leer_blob(backend: str, ruta: str | None, blob: bytes | None) -> bytes:
+    with abrir_blob(backend, ruta, blob) as flujo:
+        return flujo.read()
+
+def abrir_blob(backend: str, ruta: str | None, blob: bytes | None) -> BinaryIO:
+    """
+    Devuelve el blob cifrado como flujo de lectura para consumirlo por partes.
+    El llamador es responsable de cerrarlo.
+    """
+    return obtener_backend(backend or "db_blob").abrir(ruta, blob)
+
+def cabecera_sendfile(ruta: str) -> tuple[str, str] | None:
+    """
+    (cabecera, valor) para que el proxy sirva el blob fs por su cuenta, según
+    FILE_SENDFILE_HEADER; None si la descarga la sirve la propia app.
+    - X-Accel-Redirect (nginx): FILE_SENDFILE_PREFIX + ruta relativa a FILE_STORAGE_PATH
+    - X-Sendfile (Apache/lighttpd): ruta absoluta
+    """
+    cabecera = current_app.config.get("FILE_SENDFILE_HEADER")
+    if not cabecera:
+        return None
+    if cabecera.lower() == "x-accel-redirect":
+        relativa = os.path.relpath(os.path.abspath(ruta), os.path.abspath(current_app.config["FILE_STORAGE_PATH"]))
+        prefijo = current_app.config.get("FILE_SENDFILE_PREFIX", "/protegido").rstrip("/")
+        return cabecera, quote(f"{prefijo}/{relativa.replace(os.sep, '/')}")
+    return cabecera, os.path.abspath(ruta)
+
+def eliminar_blob(backend: str, ruta: str | None) -> None:
+    """Borra el blob físico (en db_blob desaparece con la fila)."""
+    obtener_backend(backend or "db_blob").eliminar(ruta)
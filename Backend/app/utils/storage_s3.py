@@ -0,0 +1,167 @@
+import io
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Iterable
+from .storage import BackendAlmacenamiento
+
+try:
+    import boto3
+    from botocore.config import Config as ConfigBotocore
+except ImportError:  # Dependencia opcional: sólo hace falta con FILE_STORAGE_BACKEND=s3
+    boto3 = None
+
+TAMANO_PARTE_MINIMO = 5 * 1024 * 1024  # Mínimo de S3 para todas las partes salvo la última
+
+class _LectorRangos(io.RawIOBase):
+    """
+    Objeto S3 como flujo con seek: cada lectura es un GET con Range, así que
+    un rango suelto sólo descarga los chunks que lo cubren. Se envuelve en un
+    BufferedReader para que la lectura secuencial haga GET grandes, no uno por chunk.
+    """
+    def __init__(self, cliente, bucket: str, clave: str):
+        self._cliente = cliente
+        self._bucket = bucket
+        self._clave = clave
+        self._posicion = 0
+        self._tamano = cliente.head_object(Bucket=bucket, Key=clave)["ContentLength"]
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def seek(self, desplazamiento: int, desde: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._posicion, io.SEEK_END: self._tamano}[desde]
+        self._posicion = max(0, base + desplazamiento)
+        return self._posicion
+
+    def readinto(self, destino) -> int:
+        if self._posicion >= self._tamano or len(destino) == 0:
+            return 0
+        fin = min(self._posicion + len(destino), self._tamano) - 1
+        respuesta = self._cliente.get_object(Bucket=self._bucket, Key=self._clave, Range=f"bytes={self._posicion}-{fin}")
+        datos = respuesta["Body"].read()
+        destino[:len(datos)] = datos
+        self._posicion += len(datos)
+        return len(datos)
+
+class BackendS3(BackendAlmacenamiento):
+    """
+    Almacenamiento compatible con S3 (AWS, MinIO...). La subida usa multipart
+    con varias partes en vuelo a la vez; la lectura, GET por rangos.
+    `ruta` es la clave del objeto dentro de S3_BUCKET.
+    """
+    nombre = "s3"
+
+    def __init__(self, cliente, bucket: str, prefijo: str = "", tamano_parte: int = 8 * 1024 * 1024,
+                 workers: int = 4, tamano_lectura: int = 8 * 1024 * 1024):
+        self._cliente = cliente
+        self._bucket = bucket
+        self._prefijo = prefijo.strip("/")
+        self._tamano_parte = max(TAMANO_PARTE_MINIMO, tamano_parte)
+        self._workers = max(1, workers)
+        self._tamano_lectura = tamano_lectura
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_config(cls, config) -> "BackendS3":
+        if boto3 is None:
+            raise RuntimeError("FILE_STORAGE_BACKEND=s3 requiere el paquete boto3")
+        if not config.get("S3_BUCKET"):
+            raise RuntimeError("FILE_STORAGE_BACKEND=s3 requiere S3_BUCKET")
+        cliente = boto3.client(
+            "s3",
+            endpoint_url=config.get("S3_ENDPOINT_URL") or None,
+            region_name=config.get("S3_REGION") or None,
+            aws_access_key_id=config.get("S3_ACCESS_KEY_ID") or None,
+            aws_secret_access_key=config.get("S3_SECRET_ACCESS_KEY") or None,
+            config=ConfigBotocore(max_pool_connections=max(10, 2 * config.get("S3_WORKERS", 4))),
+        )
+        return cls(
+            cliente, config["S3_BUCKET"],
+            prefijo=config.get("S3_PREFIX", ""),
+            tamano_parte=config.get("S3_PART_SIZE", 8 * 1024 * 1024),
+            workers=config.get("S3_WORKERS", 4),
+        )
+
+    def _obtener_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="s3")
+            return self._executor
+
+    def _nueva_clave(self) -> str:
+        identificador = uuid.uuid4().hex
+        clave = f"{identificador[0:2]}/{identificador[2:4]}/{identificador}.cifrado"
+        return f"{self._prefijo}/{clave}" if self._prefijo else clave
+
+    def _partes(self, chunks: Iterable[bytes]) -> Iterable[bytes]:
+        """Reagrupa los chunks cifrados en partes de tamano_parte (la última puede ser menor)."""
+        pendiente = bytearray()
+        for chunk in chunks:
+            pendiente += chunk
+            while len(pendiente) >= self._tamano_parte:
+                yield bytes(pendiente[:self._tamano_parte])
+                del pendiente[:self._tamano_parte]
+        if pendiente:
+            yield bytes(pendiente)
+
+    def guardar(self, chunks):
+        clave = self._nueva_clave()
+        partes = iter(self._partes(chunks))
+        primera = next(partes, b"")
+        segunda = next(partes, None)
+        if segunda is None:
+            # Cabe en una parte: un PUT simple
+            self._cliente.put_object(Bucket=self._bucket, Key=clave, Body=primera)
+            return clave, None
+
+        subida = self._cliente.create_multipart_upload(Bucket=self._bucket, Key=clave)["UploadId"]
+        executor = self._obtener_executor()
+        en_vuelo: deque = deque()
+        completadas = []
+
+        def _subir(numero: int, datos: bytes) -> dict:
+            r = self._cliente.upload_part(Bucket=self._bucket, Key=clave, UploadId=subida, PartNumber=numero, Body=datos)
+            return {"PartNumber": numero, "ETag": r["ETag"]}
+
+        try:
+            for numero, datos in enumerate(chain([primera, segunda], partes), start=1):
+                # Como mucho 2 * workers partes en memoria a la vez
+                if len(en_vuelo) >= 2 * self._workers:
+                    completadas.append(en_vuelo.popleft().result())
+                en_vuelo.append(executor.submit(_subir, numero, datos))
+            completadas.extend(futuro.result() for futuro in en_vuelo)
+            self._cliente.complete_multipart_upload(
+                Bucket=self._bucket, Key=clave, UploadId=subida,
+                MultipartUpload={"Parts": completadas},
+            )
+        except BaseException:
+            for futuro in en_vuelo:
+                futuro.cancel()
+            self._cliente.abort_multipart_upload(Bucket=self._bucket, Key=clave, UploadId=subida)
+            raise
+        return clave, None
+
+    def abrir(self, ruta, blob):
+        if not ruta:
+            raise FileNotFoundError("Clave de objeto S3 no encontrada")
+        return io.BufferedReader(_LectorRangos(self._cliente, self._bucket, ruta), buffer_size=self._tamano_lectura)
+
+    def leer_rango(self, ruta, blob, inicio, fin):
+        if fin <= inicio:
+            return b""
+        respuesta = self._cliente.get_object(Bucket=self._bucket, Key=ruta, Range=f"bytes={inicio}-{fin - 1}")
+        return respuesta["Body"].read()
+
+    def eliminar(self, ruta):
+        if ruta:
+            self._cliente.delete_object(Bucket=self._bucket, Key=ruta)
@@ -0,0 +1,58 @@
+import os
+import zipfile
+from datetime import datetime
+from typing import Iterable, Iterator
+
+class _SalidaZip:
+    """Destino no posicionable para ZipFile: acumula lo escrito hasta que se drena."""
+    def __init__(self):
+        self._partes: list[bytes] = []
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def drenar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+def _nombre_unico(nombre: str, usados: set[str]) -> str:
+    nombre = nombre.replace("\\", "_").replace("/", "_") or "archivo"
+    candidato, n = nombre, 1
+    base, ext = os.path.splitext(nombre)
+    while candidato in usados:
+        n += 1
+        candidato = f"{base} ({n}){ext}"
+    usados.add(candidato)
+    return candidato
+
+def generar_zip(entradas: Iterable[tuple[str, datetime | None, Iterable[bytes]]]) -> Iterator[bytes]:
+    """
+    Genera un ZIP en streaming a partir de (nombre, fecha, chunks).
+    No se guarda nada en memoria ni en disco salvo el chunk en curso: ZipFile
+    escribe sobre un destino no posicionable y usa descriptores de datos (ZIP64).
+    Los nombres repetidos se renombran como "nombre (2).ext".
+    """
+    salida = _SalidaZip()
+    usados: set[str] = set()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as zf:
+        for nombre, fecha, chunks in entradas:
+            fecha = fecha or datetime.utcnow()
+            info = zipfile.ZipInfo(_nombre_unico(nombre, usados), fecha.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with zf.open(info, "w", force_zip64=True) as destino:
+                for chunk in chunks:
+                    destino.write(chunk)
+                    datos = salida.drenar()
+                    if datos:
+                        yield datos
+            datos = salida.drenar()
+            if datos:
+                yield datos
+    datos = salida.drenar()
+    if datos:
+        yield datos
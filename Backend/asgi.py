@@ -0,0 +1,5 @@
+from app import crear_app
+from app.asgi import crear_app_asgi
+
+# Servir con un servidor ASGI, p. ej.: uvicorn asgi:app
+app = crear_app_asgi(crear_app())
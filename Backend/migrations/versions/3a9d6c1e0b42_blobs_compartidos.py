@@ -0,0 +1,56 @@
+"""blobs compartidos (deduplicación por propietario)
+
+Revision ID: 3a9d6c1e0b42
+Revises: f527c322e9bf
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9d6c1e0b42'
+down_revision = 'f527c322e9bf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blobs_compartidos',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('propietario_id', sa.BigInteger(), nullable=False),
+    sa.Column('hash_verificacion', sa.String(length=128), nullable=False),
+    sa.Column('backend_almacenamiento', sa.String(length=20), nullable=False),
+    sa.Column('ruta_almacenamiento', sa.String(length=500), nullable=True),
+    sa.Column('blob_cifrado', sa.LargeBinary(), nullable=True),
+    sa.Column('referencias', sa.Integer(), nullable=False),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['propietario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('blobs_compartidos', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_blobs_compartidos_propietario_id'), ['propietario_id'], unique=False)
+
+    # hash_verificacion existe en el modelo pero no en la migración inicial
+    columnas = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('archivos')}
+    with op.batch_alter_table('archivos', schema=None) as batch_op:
+        if 'hash_verificacion' not in columnas:
+            batch_op.add_column(sa.Column('hash_verificacion', sa.String(length=128), nullable=True))
+        batch_op.add_column(sa.Column('blob_compartido_id', sa.BigInteger(), nullable=True))
+        batch_op.create_foreign_key('fk_archivos_blob_compartido_id', 'blobs_compartidos', ['blob_compartido_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_archivos_blob_compartido_id'), ['blob_compartido_id'], unique=False)
+        batch_op.create_index('ix_archivos_propietario_hash', ['propietario_id', 'hash_verificacion'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('archivos', schema=None) as batch_op:
+        batch_op.drop_index('ix_archivos_propietario_hash')
+        batch_op.drop_index(batch_op.f('ix_archivos_blob_compartido_id'))
+        batch_op.drop_constraint('fk_archivos_blob_compartido_id', type_='foreignkey')
+        batch_op.drop_column('blob_compartido_id')
+
+    with op.batch_alter_table('blobs_compartidos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_blobs_compartidos_propietario_id'))
+
+    op.drop_table('blobs_compartidos')
@@ -0,0 +1,52 @@
+"""sesiones de subida reanudable por partes
+
+Revision ID: 5d8e2a7c9b31
+Revises: 7c2e5b9d4f18
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e2a7c9b31'
+down_revision = '7c2e5b9d4f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sesiones_subida',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('propietario_id', sa.BigInteger(), nullable=False),
+    sa.Column('nombre_original', sa.String(length=255), nullable=False),
+    sa.Column('tipo_mime', sa.String(length=120), nullable=True),
+    sa.Column('tamano_total', sa.BigInteger(), nullable=False),
+    sa.Column('tamano_parte', sa.BigInteger(), nullable=False),
+    sa.Column('tamano_chunk', sa.Integer(), nullable=False),
+    sa.Column('dek_envuelta', sa.LargeBinary(), nullable=False),
+    sa.Column('clave_id', sa.BigInteger(), nullable=False),
+    sa.Column('nonce', sa.LargeBinary(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('trabajo_id', sa.BigInteger(), nullable=True),
+    sa.Column('archivo_id', sa.BigInteger(), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.Column('expira_en', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['propietario_id'], ['usuarios.id'], ),
+    sa.ForeignKeyConstraint(['clave_id'], ['claves_cifrado_usuarios.id'], ),
+    sa.ForeignKeyConstraint(['trabajo_id'], ['trabajos.id'], ),
+    sa.ForeignKeyConstraint(['archivo_id'], ['archivos.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sesiones_subida', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sesiones_subida_propietario_id'), ['propietario_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_sesiones_subida_expira_en'), ['expira_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sesiones_subida', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sesiones_subida_expira_en'))
+        batch_op.drop_index(batch_op.f('ix_sesiones_subida_propietario_id'))
+
+    op.drop_table('sesiones_subida')
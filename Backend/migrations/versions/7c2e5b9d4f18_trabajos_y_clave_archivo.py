@@ -0,0 +1,65 @@
+"""trabajos en segundo plano y UEK de cada archivo (rotación de claves)
+
+Revision ID: 7c2e5b9d4f18
+Revises: 3a9d6c1e0b42
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e5b9d4f18'
+down_revision = '3a9d6c1e0b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trabajos',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('tipo', sa.String(length=50), nullable=False),
+    sa.Column('usuario_id', sa.BigInteger(), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('procesados', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('cursor', sa.BigInteger(), nullable=True),
+    sa.Column('parametros', sa.JSON(), nullable=True),
+    sa.Column('resultado', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.Column('actualizado_en', sa.DateTime(), nullable=True),
+    sa.Column('terminado_en', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('trabajos', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_trabajos_tipo'), ['tipo'], unique=False)
+        batch_op.create_index(batch_op.f('ix_trabajos_usuario_id'), ['usuario_id'], unique=False)
+
+    with op.batch_alter_table('archivos', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('clave_id', sa.BigInteger(), nullable=True))
+        batch_op.create_foreign_key('fk_archivos_clave_id', 'claves_cifrado_usuarios', ['clave_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_archivos_clave_id'), ['clave_id'], unique=False)
+
+    # Los archivos existentes estaban envueltos con la UEK activa de su propietario
+    op.execute(
+        "UPDATE archivos SET clave_id = ("
+        " SELECT c.id FROM claves_cifrado_usuarios c"
+        " WHERE c.usuario_id = archivos.propietario_id AND c.activa"
+        " ORDER BY c.id DESC LIMIT 1)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('archivos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archivos_clave_id'))
+        batch_op.drop_constraint('fk_archivos_clave_id', type_='foreignkey')
+        batch_op.drop_column('clave_id')
+
+    with op.batch_alter_table('trabajos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_trabajos_usuario_id'))
+        batch_op.drop_index(batch_op.f('ix_trabajos_tipo'))
+
+    op.drop_table('trabajos')
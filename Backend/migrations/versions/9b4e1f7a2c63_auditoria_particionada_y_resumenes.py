@@ -0,0 +1,131 @@
+"""auditoria particionada por meses y resumenes por hora/dia
+
+Revision ID: 9b4e1f7a2c63
+Revises: 5d8e2a7c9b31
+Create Date: 2026-10-18 18:00:00.000000
+
+En PostgreSQL registros_auditoria pasa a estar particionada por RANGE
+(creado_en) con una partición por mes (registros_auditoria_pAAAAMM) más una
+por defecto; la clave primaria pasa a ser (id, creado_en). En otros motores
+la tabla no cambia (la retención borra por meses, ver audit_retention_service).
+
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e1f7a2c63'
+down_revision = '5d8e2a7c9b31'
+branch_labels = None
+depends_on = None
+
+MESES_ADELANTE = 3
+
+COLUMNAS = """
+    id BIGINT NOT NULL DEFAULT nextval('registros_auditoria_id_seq'),
+    actor_usuario_id BIGINT REFERENCES usuarios (id),
+    accion VARCHAR(50) NOT NULL,
+    tipo_recurso VARCHAR(30),
+    recurso_id VARCHAR(100),
+    ip VARCHAR(64),
+    agente_usuario VARCHAR(255),
+    estado VARCHAR(20) NOT NULL,
+    detalles JSON,
+    creado_en TIMESTAMP WITHOUT TIME ZONE NOT NULL
+"""
+
+
+def _mes_siguiente(mes):
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def _convertir_a_particionada():
+    conexion = op.get_bind()
+    # La secuencia de id sobrevive a la tabla antigua y la sigue usando la nueva
+    op.execute("ALTER SEQUENCE registros_auditoria_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE registros_auditoria RENAME TO registros_auditoria_antigua")
+    op.execute("ALTER TABLE registros_auditoria_antigua RENAME CONSTRAINT registros_auditoria_pkey TO registros_auditoria_antigua_pkey")
+    op.execute("ALTER INDEX ix_registros_auditoria_actor_usuario_id RENAME TO ix_registros_auditoria_antigua_actor_usuario_id")
+    op.execute(f"""
+        CREATE TABLE registros_auditoria ({COLUMNAS},
+            CONSTRAINT registros_auditoria_pkey PRIMARY KEY (id, creado_en)
+        ) PARTITION BY RANGE (creado_en)
+    """)
+    op.execute("CREATE INDEX ix_registros_auditoria_actor_usuario_id ON registros_auditoria (actor_usuario_id)")
+
+    minimo = conexion.execute(sa.text("SELECT min(creado_en) FROM registros_auditoria_antigua")).scalar()
+    hoy = datetime.utcnow()
+    mes = date((minimo or hoy).year, (minimo or hoy).month, 1)
+    ultimo = date(hoy.year, hoy.month, 1)
+    for _ in range(MESES_ADELANTE):
+        ultimo = _mes_siguiente(ultimo)
+    while mes <= ultimo:
+        siguiente = _mes_siguiente(mes)
+        op.execute(
+            f"CREATE TABLE registros_auditoria_p{mes:%Y%m} PARTITION OF registros_auditoria "
+            f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{siguiente.isoformat()}')"
+        )
+        mes = siguiente
+    op.execute("CREATE TABLE registros_auditoria_pdefecto PARTITION OF registros_auditoria DEFAULT")
+
+    op.execute("INSERT INTO registros_auditoria SELECT * FROM registros_auditoria_antigua")
+    op.execute("DROP TABLE registros_auditoria_antigua")
+    op.execute("ALTER SEQUENCE registros_auditoria_id_seq OWNED BY registros_auditoria.id")
+
+
+def _convertir_a_simple():
+    op.execute("ALTER SEQUENCE registros_auditoria_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE registros_auditoria RENAME TO registros_auditoria_particionada")
+    op.execute("ALTER TABLE registros_auditoria_particionada RENAME CONSTRAINT registros_auditoria_pkey TO registros_auditoria_particionada_pkey")
+    op.execute("ALTER INDEX ix_registros_auditoria_actor_usuario_id RENAME TO ix_registros_auditoria_particionada_actor_usuario_id")
+    op.execute(f"""
+        CREATE TABLE registros_auditoria ({COLUMNAS},
+            CONSTRAINT registros_auditoria_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("CREATE INDEX ix_registros_auditoria_actor_usuario_id ON registros_auditoria (actor_usuario_id)")
+    op.execute("INSERT INTO registros_auditoria SELECT * FROM registros_auditoria_particionada")
+    # Borra también todas las particiones
+    op.execute("DROP TABLE registros_auditoria_particionada")
+    op.execute("ALTER SEQUENCE registros_auditoria_id_seq OWNED BY registros_auditoria.id")
+
+
+def upgrade():
+    op.create_table('resumenes_auditoria',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('granularidad', sa.String(length=10), nullable=False),
+    sa.Column('periodo', sa.DateTime(), nullable=False),
+    sa.Column('accion', sa.String(length=50), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('actor_usuario_id', sa.BigInteger(), nullable=False),
+    sa.Column('total', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('granularidad', 'periodo', 'accion', 'estado', 'actor_usuario_id', name='uq_resumenes_auditoria_clave')
+    )
+
+    dialecto = op.get_bind().dialect.name
+    if dialecto == 'postgresql':
+        _convertir_a_particionada()
+
+    # Resúmenes del histórico existente
+    if dialecto == 'postgresql':
+        truncar = {'hora': "date_trunc('hour', creado_en)", 'dia': "date_trunc('day', creado_en)"}
+    else:
+        # Mismo formato de texto con el que SQLAlchemy guarda DateTime en SQLite
+        truncar = {'hora': "strftime('%Y-%m-%d %H:00:00.000000', creado_en)",
+                   'dia': "strftime('%Y-%m-%d 00:00:00.000000', creado_en)"}
+    for granularidad, expresion in truncar.items():
+        op.execute(f"""
+            INSERT INTO resumenes_auditoria (granularidad, periodo, accion, estado, actor_usuario_id, total)
+            SELECT '{granularidad}', {expresion}, accion, estado, COALESCE(actor_usuario_id, 0), count(*)
+            FROM registros_auditoria
+            GROUP BY {expresion}, accion, estado, COALESCE(actor_usuario_id, 0)
+        """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _convertir_a_simple()
+    op.drop_table('resumenes_auditoria')
@@ -0,0 +1,36 @@
+"""indices compuestos para la paginacion por clave de la auditoria
+
+Revision ID: a1c7e3d95f20
+Revises: 9b4e1f7a2c63
+Create Date: 2026-10-18 20:00:00.000000
+
+En PostgreSQL registros_auditoria está particionada: cada índice creado en
+la tabla padre se crea también en todas sus particiones (y en las futuras).
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c7e3d95f20'
+down_revision = '9b4e1f7a2c63'
+branch_labels = None
+depends_on = None
+
+INDICES = {
+    'ix_registros_auditoria_creado_en_id': ['creado_en', 'id'],
+    'ix_registros_auditoria_accion_creado_en_id': ['accion', 'creado_en', 'id'],
+    'ix_registros_auditoria_estado_creado_en_id': ['estado', 'creado_en', 'id'],
+    'ix_registros_auditoria_accion_estado_creado_en_id': ['accion', 'estado', 'creado_en', 'id'],
+}
+
+
+def upgrade():
+    for nombre, columnas in INDICES.items():
+        op.create_index(nombre, 'registros_auditoria', columnas, unique=False)
+
+
+def downgrade():
+    for nombre in reversed(list(INDICES)):
+        op.drop_index(nombre, table_name='registros_auditoria')